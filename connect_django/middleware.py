@@ -1,20 +1,18 @@
 # connect_django/middleware.py
 import jwt
 from django.conf import settings
-from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from urllib.parse import parse_qs
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from user.identity import cached_user
 
 @database_sync_to_async
 def get_user(user_id):
-    try:
-        # Make sure you're fetching the User model, not Profile
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        return AnonymousUser()
+    # A lightweight User (id, username, is_active, profile_id), usually from the cache
+    return cached_user(user_id) or AnonymousUser()
 
 class TokenAuthMiddleware(BaseMiddleware):
     """
@@ -104,6 +104,52 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Chat messages: broadcast first and persist in batches (messaging.writer)
+MESSAGING_WRITE_BEHIND = env.bool('MESSAGING_WRITE_BEHIND', default=False)
+MESSAGING_FLUSH_INTERVAL_MS = env.int('MESSAGING_FLUSH_INTERVAL_MS', default=50)
+MESSAGING_FLUSH_SIZE = env.int('MESSAGING_FLUSH_SIZE', default=100)
+
+# Most missed messages a reconnecting chat socket replays (?last_seen_id=)
+MESSAGING_CATCH_UP_LIMIT = env.int('MESSAGING_CATCH_UP_LIMIT', default=1000)
+# Rooms a ws/user/ socket joins on connect, most recently active first
+MESSAGING_SOCKET_ROOMS = env.int('MESSAGING_SOCKET_ROOMS', default=100)
+# Frames a socket may have queued before it counts as too slow (messaging.outbox)
+MESSAGING_OUTBOX_SIZE = env.int('MESSAGING_OUTBOX_SIZE', default=256)
+
+# Presence (user.presence): "redis" in production, "local" keeps it in-process
+PRESENCE_BACKEND = env('PRESENCE_BACKEND', default='redis')
+PRESENCE_REDIS_URL = env('PRESENCE_REDIS_URL', default='redis://127.0.0.1:6379/2')
+PRESENCE_TTL_SECONDS = env.int('PRESENCE_TTL_SECONDS', default=60)
+PRESENCE_FLUSH_SECONDS = env.int('PRESENCE_FLUSH_SECONDS', default=60)
+
+# WebSocket handshakes resolve users and room participants from the cache
+# (user.identity, messaging.services.room_participants); entries are dropped
+# when the user, profile or room changes
+WS_IDENTITY_CACHE_SECONDS = env.int('WS_IDENTITY_CACHE_SECONDS', default=300)
+
+# Cache (swipe decks and other short-lived per-user state); same Redis as the channel layer by default
+CACHES = {
+    'default': env.cache('CACHE_URL', default='redis://127.0.0.1:6379/1'),
+}
+
+# Swipe deck candidate lookup: "database" (geo-cell query) or "memory" (matches.engine)
+MATCHES_CANDIDATE_ENGINE = env('MATCHES_CANDIDATE_ENGINE', default='database')
+MATCHES_ENGINE_REFRESH_SECONDS = env.int('MATCHES_ENGINE_REFRESH_SECONDS', default=5)
+MATCHES_ENGINE_REBUILD_SECONDS = env.int('MATCHES_ENGINE_REBUILD_SECONDS', default=600)
+
+# Weight of interest overlap vs. closeness for /match/get?rank=interests (matches.ranking)
+MATCHES_INTEREST_WEIGHT = env.float('MATCHES_INTEREST_WEIGHT', default=0.5)
+
+# Precomputed swipe decks (matches.deck)
+MATCHES_DECK_SIZE = env.int('MATCHES_DECK_SIZE', default=100)
+MATCHES_DECK_LOW_WATERMARK = env.int('MATCHES_DECK_LOW_WATERMARK', default=20)
+MATCHES_DECK_MOVE_KM = env.float('MATCHES_DECK_MOVE_KM', default=1.0)
+MATCHES_DECK_TTL_SECONDS = env.int('MATCHES_DECK_TTL_SECONDS', default=6 * 60 * 60)
+MATCHES_DECK_EXHAUSTED_RETRY_SECONDS = env.int('MATCHES_DECK_EXHAUSTED_RETRY_SECONDS', default=5 * 60)
+
+# Open a ChatRoom for both users as soon as they match (matches.notifications)
+MATCHES_CREATE_CHAT_ROOMS = env.bool('MATCHES_CREATE_CHAT_ROOMS', default=False)
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
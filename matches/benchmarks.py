@@ -0,0 +1,91 @@
+"""Helpers shared by the matches benchmark management commands."""
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from user.models import Profile
+
+BENCH_USERNAME_PREFIX = "bench_"
+GENDERS = ["M", "F"]
+INTERESTS = [
+    "music", "sports", "travel", "movies", "books", "cooking", "gaming", "art",
+    "fitness", "hiking", "photography", "dancing", "tech", "fashion", "pets", "yoga",
+]
+
+
+def bench_profiles():
+    return Profile.objects.filter(user__username__startswith=BENCH_USERNAME_PREFIX)
+
+
+def seed_profiles(target_count, center=(12.9716, 77.5946), spread_km=30, batch_size=5000, stdout=None):
+    """Grow the synthetic profile pool to `target_count` rows scattered around `center`."""
+    existing = bench_profiles().count()
+    lat_spread = spread_km / 111.045
+    lon_spread = lat_spread
+
+    while existing < target_count:
+        count = min(batch_size, target_count - existing)
+        users = User.objects.bulk_create([
+            User(username=f"{BENCH_USERNAME_PREFIX}{existing + i}", password="!")
+            for i in range(count)
+        ])
+        profiles = []
+        for user in users:
+            profile = Profile(
+                user=user,
+                name=user.username,
+                gender=random.choice(GENDERS),
+                age=random.randint(18, 60),
+                latitude=round(random.gauss(center[0], lat_spread), 6),
+                longitude=round(random.gauss(center[1], lon_spread), 6),
+                interests=random.sample(INTERESTS, random.randint(1, 5)),
+            )
+            profile.sync_geo_cells()
+            profiles.append(profile)
+        Profile.objects.bulk_create(profiles)
+        existing += count
+        if stdout:
+            stdout.write(f"  seeded {existing}/{target_count} profiles")
+
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Profile._meta.db_table}")
+
+
+def clear_bench_profiles(batch_size=10000):
+    users = User.objects.filter(username__startswith=BENCH_USERNAME_PREFIX)
+    while True:
+        ids = list(users.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        User.objects.filter(id__in=ids).delete()
+
+
+def sample_profiles(count):
+    """Pick `count` random synthetic profiles to issue queries as."""
+    ids = list(bench_profiles().values_list("id", flat=True).order_by("?")[:count])
+    return list(Profile.objects.filter(id__in=ids))
+
+
+def time_calls(fn, args_list):
+    """Call fn(*args) for each args tuple and return (latencies_ms, results)."""
+    latencies = []
+    results = []
+    for args in args_list:
+        started = time.perf_counter()
+        results.append(fn(*args))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies, results
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    p95_index = max(0, int(round(0.95 * len(ordered))) - 1)
+    return {
+        "p50": statistics.median(ordered),
+        "p95": ordered[p95_index],
+        "mean": statistics.fmean(ordered),
+    }
@@ -0,0 +1,193 @@
+"""
+Per-user precomputed swipe decks.
+
+A deck is the ordered list of (profile id, distance) candidates for a user at
+a given origin and radius, cached under deck:<profile_id>. Serving the next
+cards only reads the head of that list; swipes pop entries; a background
+thread rebuilds it when it runs low or when the user moves more than
+MATCHES_DECK_MOVE_KM, so the full candidate query stays off the request path.
+An exhausted deck (the area had fewer candidates than MATCHES_DECK_SIZE) is
+searched again once MATCHES_DECK_EXHAUSTED_RETRY_SECONDS have passed.
+
+Every write to a deck happens under a short per-deck cache lock, so
+concurrent swipes from one user cannot write back cards another swipe
+already popped.
+"""
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Exists, OuterRef
+
+from user.geo import haversine
+from user.models import Profile
+from .models import Swipe
+
+logger = logging.getLogger(__name__)
+
+CARD_FIELDS = ("id", "name", "gender", "age", "profile_picture", "about")
+
+# A deck write is one cache get and set; the lock only has to outlive that
+DECK_LOCK_SECONDS = 5
+DECK_LOCK_WAIT_SECONDS = 2
+
+_refill_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="deck-refill")
+
+
+def _deck_key(profile_id):
+    return f"deck:{profile_id}"
+
+
+def _refill_lock_key(profile_id):
+    return f"deck:{profile_id}:refilling"
+
+
+def _write_lock_key(profile_id):
+    return f"deck:{profile_id}:writing"
+
+
+@contextmanager
+def _deck_lock(profile_id, wait=DECK_LOCK_WAIT_SECONDS):
+    """Hold `profile_id`'s deck write lock; yields False if it was not free within `wait` seconds."""
+    key = _write_lock_key(profile_id)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while not cache.add(key, token, timeout=DECK_LOCK_SECONDS):
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(0.01)
+    try:
+        yield True
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def build_deck(profile, radius_km):
+    """Rank the next MATCHES_DECK_SIZE candidates for `profile` and cache them."""
+    from .services import find_nearby_profiles  # services imports this module for discard_from_deck
+
+    deck_size = settings.MATCHES_DECK_SIZE
+    nearby = find_nearby_profiles(profile, radius_km, limit=deck_size)
+    with _deck_lock(profile.id) as locked:
+        # Drop cards swiped while the candidate query ran; their discards found the old deck
+        swiped = set(Swipe.objects.filter(
+            swiper=profile, target_id__in=[card["id"] for card in nearby]
+        ).values_list("target_id", flat=True))
+        deck = {
+            "latitude": float(profile.latitude),
+            "longitude": float(profile.longitude),
+            "radius": float(radius_km),
+            "cards": [[card["id"], card["distance"]] for card in nearby if card["id"] not in swiped],
+            # Fewer than a full deck means the area is exhausted; don't refill on every swipe
+            "exhausted": len(nearby) < deck_size,
+            "built_at": time.time(),
+        }
+        if locked:
+            cache.set(_deck_key(profile.id), deck, settings.MATCHES_DECK_TTL_SECONDS)
+    return deck
+
+
+def _has_moved(deck, profile):
+    distance = haversine(deck["latitude"], deck["longitude"], profile.latitude, profile.longitude)
+    return distance > settings.MATCHES_DECK_MOVE_KM
+
+
+def _needs_refill(deck, count):
+    if len(deck["cards"]) - count >= settings.MATCHES_DECK_LOW_WATERMARK:
+        return False
+    if not deck["exhausted"]:
+        return True
+    # Profiles may have joined the area since; look again after a backoff
+    return time.time() - deck.get("built_at", 0) >= settings.MATCHES_DECK_EXHAUSTED_RETRY_SECONDS
+
+
+def schedule_refill(profile_id, radius_km):
+    """Rebuild a deck in the background; at most one rebuild per user at a time."""
+    if not cache.add(_refill_lock_key(profile_id), True, timeout=60):
+        return
+    _refill_executor.submit(_refill, profile_id, radius_km)
+
+
+def _refill(profile_id, radius_km):
+    try:
+        profile = Profile.objects.get(id=profile_id)
+        if profile.latitude is not None and profile.longitude is not None:
+            build_deck(profile, radius_km)
+    except Exception:
+        logger.exception("Refilling the swipe deck for profile %s failed", profile_id)
+    finally:
+        cache.delete(_refill_lock_key(profile_id))
+        connections.close_all()
+
+
+def next_cards(profile, count, radius_km):
+    """
+    Return up to `count` cards from the head of `profile`'s deck, nearest first,
+    plus how many candidates remain queued. Builds the deck inline only when
+    there is none yet, or the radius or location no longer match it.
+    """
+    deck = cache.get(_deck_key(profile.id))
+    if deck is None or deck["radius"] != float(radius_km) or _has_moved(deck, profile):
+        deck = build_deck(profile, radius_km)
+    elif _needs_refill(deck, count):
+        schedule_refill(profile.id, radius_km)
+
+    head = deck["cards"][:count]
+    # Swipes pop the deck, but guard against a pop racing this read
+    already_swiped = Swipe.objects.filter(swiper=profile, target=OuterRef("pk"))
+    head_cards = Profile.objects.filter(
+        id__in=[profile_id for profile_id, _ in head]
+    ).exclude(
+        Exists(already_swiped)
+    ).values(*CARD_FIELDS)
+    cards = {card["id"]: card for card in head_cards}
+
+    result = []
+    for profile_id, distance in head:
+        card = cards.get(profile_id)
+        if card is not None:
+            card["distance"] = distance
+            result.append(card)
+    return result, len(deck["cards"])
+
+
+def discard_from_deck(profile_id, target_ids):
+    """
+    Pop swiped profiles from a cached deck. Best effort: it runs on the swipe
+    path, so a busy lock or a cache error leaves the deck as it is rather than
+    delaying or failing the swipe; next_cards skips swiped cards either way.
+    """
+    key = _deck_key(profile_id)
+    try:
+        with _deck_lock(profile_id, wait=0) as locked:
+            if not locked:
+                return
+            deck = cache.get(key)
+            if not deck:
+                return
+            target_ids = set(target_ids)
+            deck["cards"] = [card for card in deck["cards"] if card[0] not in target_ids]
+            cache.set(key, deck, settings.MATCHES_DECK_TTL_SECONDS)
+    except Exception:
+        logger.exception("Popping swiped cards from the deck of profile %s failed", profile_id)
+
+
+def clear_deck(profile_id):
+    """Drop a cached deck, e.g. after its owner's discovery preferences change."""
+    cache.delete(_deck_key(profile_id))
+
+
+def refill_if_moved(profile):
+    """Queue a rebuild when a saved location is far enough from the deck's origin."""
+    if profile.latitude is None or profile.longitude is None:
+        return
+    deck = cache.get(_deck_key(profile.id))
+    if deck and _has_moved(deck, profile):
+        schedule_refill(profile.id, deck["radius"])
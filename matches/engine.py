@@ -0,0 +1,226 @@
+"""
+In-process candidate engine for swipe decks.
+
+Keeps an array-backed snapshot of every located profile (id, lat, lon, gender
+code, age) and answers radius queries with one vectorized haversine pass plus
+partial selection, instead of building a Profile instance per candidate.
+
+Enable it per deployment with MATCHES_CANDIDATE_ENGINE = "memory". The snapshot
+is per process: it pulls rows changed since its last refresh (by updated_at),
+applies local saves/deletes through signals, and rebuilds from scratch every
+MATCHES_ENGINE_REBUILD_SECONDS to pick up deletes made by other processes.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+
+from user.geo import RADIUS_OF_EARTH_KM
+from user.models import Profile
+
+DATABASE_ENGINE = "database"
+MEMORY_ENGINE = "memory"
+
+# Re-read rows this far behind the watermark so commits that land out of order are not missed
+REFRESH_OVERLAP = timedelta(seconds=2)
+
+_SNAPSHOT_FIELDS = ("id", "latitude", "longitude", "gender", "age", "updated_at")
+
+
+def memory_engine_enabled():
+    return getattr(settings, "MATCHES_CANDIDATE_ENGINE", DATABASE_ENGINE) == MEMORY_ENGINE
+
+
+class CandidateEngine:
+    def __init__(self, refresh_seconds=5, rebuild_seconds=600):
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.Lock()
+        self._gender_codes = {}
+        self._reset(capacity=0)
+        self._watermark = None
+        self._refreshed_at = 0.0
+        self._rebuilt_at = 0.0
+
+    def _reset(self, capacity):
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.lat = np.zeros(capacity, dtype=np.float64)  # radians
+        self.lon = np.zeros(capacity, dtype=np.float64)  # radians
+        self.cos_lat = np.zeros(capacity, dtype=np.float64)
+        self.gender = np.zeros(capacity, dtype=np.int16)
+        self.age = np.full(capacity, -1, dtype=np.int16)
+        self.active = np.zeros(capacity, dtype=bool)
+        self._rows = {}  # profile id -> row index
+
+    def gender_code(self, gender):
+        code = self._gender_codes.get(gender)
+        if code is None:
+            code = self._gender_codes[gender] = len(self._gender_codes)
+        return code
+
+    # --- Loading and refreshing ---
+
+    def rebuild(self):
+        """Reload the snapshot from the database."""
+        rows = list(
+            Profile.objects.filter(latitude__isnull=False, longitude__isnull=False)
+            .values_list(*_SNAPSHOT_FIELDS)
+            .iterator(chunk_size=20000)
+        )
+        with self._lock:
+            self._reset(capacity=max(len(rows), 1024))
+            self._apply(rows)
+            self._rebuilt_at = self._refreshed_at = time.monotonic()
+
+    def refresh(self):
+        """Apply rows changed since the last refresh."""
+        queryset = Profile.objects.all()
+        if self._watermark is not None:
+            queryset = queryset.filter(updated_at__gte=self._watermark - REFRESH_OVERLAP)
+        rows = list(queryset.values_list(*_SNAPSHOT_FIELDS))
+        with self._lock:
+            self._apply(rows)
+            self._refreshed_at = time.monotonic()
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if self._rebuilt_at == 0.0 or now - self._rebuilt_at >= self.rebuild_seconds:
+            self.rebuild()
+        elif now - self._refreshed_at >= self.refresh_seconds:
+            self.refresh()
+
+    def upsert(self, profile):
+        """Apply a single saved Profile instance."""
+        row = (profile.id, profile.latitude, profile.longitude, profile.gender, profile.age, profile.updated_at)
+        with self._lock:
+            self._apply([row])
+
+    def remove(self, profile_id):
+        with self._lock:
+            index = self._rows.get(profile_id)
+            if index is not None:
+                self.active[index] = False
+
+    def _apply(self, rows):
+        for profile_id, latitude, longitude, gender, age, updated_at in rows:
+            if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+            index = self._rows.get(profile_id)
+            if latitude is None or longitude is None:
+                if index is not None:
+                    self.active[index] = False
+                continue
+
+            if index is None:
+                if self.size == len(self.ids):
+                    self._grow()
+                index = self.size
+                self.size += 1
+                self._rows[profile_id] = index
+
+            lat = np.radians(float(latitude))
+            self.ids[index] = profile_id
+            self.lat[index] = lat
+            self.lon[index] = np.radians(float(longitude))
+            self.cos_lat[index] = np.cos(lat)
+            self.gender[index] = self.gender_code(gender)
+            self.age[index] = -1 if age is None else age
+            self.active[index] = True
+
+    def _grow(self):
+        capacity = max(1024, len(self.ids) * 2)
+        for name in ("ids", "lat", "lon", "cos_lat", "gender", "age", "active"):
+            current = getattr(self, name)
+            grown = np.zeros(capacity, dtype=current.dtype)
+            if name == "age":
+                grown[:] = -1
+            grown[:len(current)] = current
+            setattr(self, name, grown)
+
+    # --- Queries ---
+
+    def nearest(self, latitude, longitude, radius_km, exclude_gender, exclude_ids=(), limit=None, after=None,
+                genders=None, min_age=None, max_age=None):
+        """
+        Return [(profile_id, distance_km), ...] within `radius_km`, ordered by
+        (distance, id), skipping profiles of `exclude_gender`, those in
+        `exclude_ids` and, when `after` is a (distance, id) pair, those
+        ordered at or before it.
+
+        `genders` (which overrides `exclude_gender`), `min_age` and `max_age`
+        restrict candidates the same way DiscoveryPreferences do in the
+        database; unknown ages never match an age bound.
+
+        When `limit` is given only the `limit` nearest are selected, using
+        argpartition so the full candidate set is never sorted.
+        """
+        if limit is not None and limit <= 0:
+            return []
+
+        with self._lock:
+            size = self.size
+            ids = self.ids[:size]
+            lat = self.lat[:size]
+            lon = self.lon[:size]
+            cos_lat = self.cos_lat[:size]
+            mask = self.active[:size].copy()
+            if genders is not None:
+                codes = [self._gender_codes[gender] for gender in genders if gender in self._gender_codes]
+                mask &= np.isin(self.gender[:size], codes)
+            elif exclude_gender in self._gender_codes:
+                mask &= self.gender[:size] != self._gender_codes[exclude_gender]
+            if min_age is not None:
+                mask &= self.age[:size] >= min_age
+            if max_age is not None:
+                mask &= (self.age[:size] >= 0) & (self.age[:size] <= max_age)
+
+        lat0 = np.radians(float(latitude))
+        lon0 = np.radians(float(longitude))
+        a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat0) * cos_lat * np.sin((lon - lon0) / 2) ** 2
+        distances = np.round(2 * RADIUS_OF_EARTH_KM * np.arcsin(np.sqrt(a)), 2)
+
+        mask &= distances <= float(radius_km)
+        if exclude_ids:
+            mask &= ~np.isin(ids, np.fromiter(exclude_ids, dtype=np.int64))
+
+        if after is not None:
+            last_distance, last_id = after
+            mask &= (distances > last_distance) | ((distances == last_distance) & (ids > last_id))
+
+        candidates = np.flatnonzero(mask)
+        if limit is not None and len(candidates) > limit:
+            nearest = np.argpartition(distances[candidates], limit - 1)[:limit]
+            candidates = candidates[nearest]
+
+        order = np.lexsort((ids[candidates], distances[candidates]))
+        candidates = candidates[order]
+        return list(zip(ids[candidates].tolist(), distances[candidates].tolist()))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return this process's engine, loading it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = CandidateEngine(
+                    refresh_seconds=getattr(settings, "MATCHES_ENGINE_REFRESH_SECONDS", 5),
+                    rebuild_seconds=getattr(settings, "MATCHES_ENGINE_REBUILD_SECONDS", 600),
+                )
+                engine.rebuild()
+                _engine = engine
+    _engine.ensure_fresh()
+    return _engine
+
+
+def loaded_engine():
+    """Return the engine if this process has already loaded it, else None."""
+    return _engine
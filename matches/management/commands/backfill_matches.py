@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, F, OuterRef
+
+from matches.models import Swipe
+from matches.services import create_matches
+from user.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Create Match rows for mutual likes that happened before matches were recorded. "
+        "Reads the swipes table, so run backfill_swipes first to include the legacy like arrays. "
+        "Sends no match notifications."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Swipers per batch.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        liked_back = Swipe.objects.filter(
+            swiper=OuterRef("target"), target=OuterRef("swiper"), action=Swipe.LIKE
+        )
+
+        total = 0
+        last_id = 0
+        while True:
+            swiper_ids = list(
+                Profile.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not swiper_ids:
+                break
+            last_id = swiper_ids[-1]
+
+            # Each pair is found once, from the side with the smaller id
+            pairs = Swipe.objects.filter(
+                swiper_id__in=swiper_ids, action=Swipe.LIKE, target_id__gt=F("swiper_id")
+            ).filter(Exists(liked_back)).values_list("swiper_id", "target_id")
+
+            by_swiper = {}
+            for swiper_id, target_id in pairs:
+                by_swiper.setdefault(swiper_id, []).append(target_id)
+            for swiper_id, partner_ids in by_swiper.items():
+                # Historic matches: no live events, and no chat rooms with MATCHES_CREATE_CHAT_ROOMS
+                total += len(create_matches(Profile(id=swiper_id), partner_ids, notify=False))
+
+            self.stdout.write(f"Scanned profiles up to id {last_id}, {total} matches so far...")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} matches."))
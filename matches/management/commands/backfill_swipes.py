@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from matches.models import Swipe
+from user.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the legacy Profile.like / Profile.dislike arrays into the swipes table. "
+        "Existing swipe rows win, so it is safe to re-run while the app is serving swipes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Profiles per transaction.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        queryset = Profile.objects.exclude(like=[], dislike=[]).only("id", "like", "dislike").order_by("id")
+
+        total_profiles = 0
+        total_swipes = 0
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            target_ids = set()
+            for profile in batch:
+                target_ids.update(profile.like)
+                target_ids.update(profile.dislike)
+            existing_ids = set(Profile.objects.filter(id__in=target_ids).values_list("id", flat=True))
+
+            swipes = []
+            for profile in batch:
+                actions = {target: Swipe.DISLIKE for target in profile.dislike}
+                # updateList kept the lists disjoint; if not, the like wins
+                actions.update({target: Swipe.LIKE for target in profile.like})
+                swipes.extend(
+                    Swipe(swiper_id=profile.id, target_id=target, action=action)
+                    for target, action in actions.items()
+                    if target in existing_ids and target != profile.id
+                )
+
+            with transaction.atomic():
+                Swipe.objects.bulk_create(swipes, batch_size=5000, ignore_conflicts=True)
+
+            total_profiles += len(batch)
+            total_swipes += len(swipes)
+            self.stdout.write(f"Processed {total_profiles} profiles...")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled up to {total_swipes} swipes from {total_profiles} profiles."
+        ))
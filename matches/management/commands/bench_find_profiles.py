@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+
+from matches.benchmarks import clear_bench_profiles, sample_profiles, seed_profiles, summarize, time_calls
+from matches.engine import get_engine
+from matches.services import (
+    find_nearby_profiles_by_interest,
+    find_nearby_profiles_in_database,
+    find_nearby_profiles_in_memory,
+)
+
+DEFAULT_SIZES = "10000,100000,1000000,5000000"
+
+
+def run_bbox(profile, radius_km, limit=None):
+    return find_nearby_profiles_in_database(profile, radius_km, use_geo_cells=False, limit=limit)
+
+
+def run_geocell(profile, radius_km, limit=None):
+    return find_nearby_profiles_in_database(profile, radius_km, use_geo_cells=True, limit=limit)
+
+
+def run_memory(profile, radius_km, limit=None):
+    return find_nearby_profiles_in_memory(profile, radius_km, limit=limit)
+
+
+def run_interests(profile, radius_km, limit=None):
+    return find_nearby_profiles_by_interest(profile, radius_km, limit=limit)
+
+
+PATHS = {
+    "bbox": run_bbox,
+    "geocell": run_geocell,
+    "memory": run_memory,
+    "interests": run_interests,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark find_profiles candidate lookup latency against a growing synthetic profile table. "
+        "Writes bench_* users to the configured database; run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma separated table sizes, ascending.")
+        parser.add_argument("--paths", default=",".join(PATHS), help=f"Any of: {', '.join(PATHS)}")
+        parser.add_argument("--radius", type=float, default=10)
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--limit", type=int, default=None, help="Page size; omit to rank the whole radius.")
+        parser.add_argument("--spread-km", type=float, default=30)
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic profiles afterwards.")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        paths = [path.strip() for path in options["paths"].split(",")]
+        radius_km = options["radius"]
+
+        self.stdout.write(f"{'profiles':>10} {'path':>10} {'p50 ms':>10} {'p95 ms':>10} {'mean ms':>10} {'results':>8}")
+        try:
+            for size in sizes:
+                seed_profiles(size, spread_km=options["spread_km"], stdout=self.stdout)
+                subjects = [(profile, radius_km, options["limit"]) for profile in sample_profiles(options["queries"])]
+                if "memory" in paths:
+                    get_engine().rebuild()
+
+                for path in paths:
+                    fn = PATHS[path]
+                    fn(*subjects[0])  # warm up
+                    latencies, results = time_calls(fn, subjects)
+                    stats = summarize(latencies)
+                    avg_results = sum(len(r) for r in results) / len(results)
+                    self.stdout.write(
+                        f"{size:>10} {path:>10} {stats['p50']:>10.2f} {stats['p95']:>10.2f} "
+                        f"{stats['mean']:>10.2f} {avg_results:>8.1f}"
+                    )
+        finally:
+            if not options["keep"]:
+                clear_bench_profiles()
@@ -0,0 +1,74 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from matches.benchmarks import bench_profiles, clear_bench_profiles, sample_profiles, seed_profiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare swipe throughput of POST /match/swipe against POST /match/swipe/batch. "
+        "Writes bench_* users to the configured database; run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", type=int, default=20000)
+        parser.add_argument("--swipers", type=int, default=20)
+        parser.add_argument("--swipes", type=int, default=2000, help="Swipes per path.")
+        parser.add_argument("--batch-size", type=int, default=25)
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic profiles afterwards.")
+
+    def handle(self, *args, **options):
+        seed_profiles(options["profiles"], stdout=self.stdout)
+        target_ids = list(bench_profiles().values_list("id", flat=True))
+        swipers = sample_profiles(options["swipers"] * 2)
+        single_swipers, batch_swipers = swipers[::2], swipers[1::2]
+        swipes_per_swiper = options["swipes"] // len(single_swipers)
+
+        try:
+            single = self.run_single(single_swipers, target_ids, swipes_per_swiper)
+            batch = self.run_batch(batch_swipers, target_ids, swipes_per_swiper, options["batch_size"])
+        finally:
+            if not options["keep"]:
+                clear_bench_profiles()
+
+        self.stdout.write(f"{'path':>12} {'swipes':>8} {'seconds':>9} {'swipes/sec':>11}")
+        for name, (count, seconds) in (("single", single), (f"batch({options['batch_size']})", batch)):
+            self.stdout.write(f"{name:>12} {count:>8} {seconds:>9.2f} {count / seconds:>11.1f}")
+
+    def swipes_for(self, profile, target_ids, count):
+        targets = random.sample(target_ids, count + 1)
+        return [
+            {"other_id": target, "action": random.choice(["like", "dislike"])}
+            for target in targets if target != profile.id
+        ][:count]
+
+    def run_single(self, swipers, target_ids, swipes_per_swiper):
+        count = 0
+        elapsed = 0.0
+        for profile in swipers:
+            client = APIClient()
+            client.force_authenticate(profile.user)
+            swipes = self.swipes_for(profile, target_ids, swipes_per_swiper)
+            started = time.perf_counter()
+            for swipe in swipes:
+                client.post("/match/swipe", swipe, format="json")
+            elapsed += time.perf_counter() - started
+            count += len(swipes)
+        return count, elapsed
+
+    def run_batch(self, swipers, target_ids, swipes_per_swiper, batch_size):
+        count = 0
+        elapsed = 0.0
+        for profile in swipers:
+            client = APIClient()
+            client.force_authenticate(profile.user)
+            swipes = self.swipes_for(profile, target_ids, swipes_per_swiper)
+            started = time.perf_counter()
+            for start in range(0, len(swipes), batch_size):
+                client.post("/match/swipe/batch", {"swipes": swipes[start:start + batch_size]}, format="json")
+            elapsed += time.perf_counter() - started
+            count += len(swipes)
+        return count, elapsed
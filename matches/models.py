@@ -1,3 +1,123 @@
+from django.contrib.postgres.fields import ArrayField
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from user.models import Profile
 
-# Create your models here.
+
+class Swipe(models.Model):
+    """One row per (swiper, target) pair holding the swiper's latest decision."""
+    LIKE = "like"
+    DISLIKE = "dislike"
+    ACTION_CHOICES = [
+        (LIKE, "Like"),
+        (DISLIKE, "Dislike"),
+    ]
+
+    swiper = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name="swipes_made"
+    )
+    target = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name="swipes_received"
+    )
+    action = models.CharField(max_length=7, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "swipes"
+        constraints = [
+            # Also serves swiper-scoped lookups: the anti-join in find_profiles
+            models.UniqueConstraint(fields=["swiper", "target"], name="unique_swipe_per_pair"),
+        ]
+        indexes = [
+            # Reverse index for "who liked me": one range scan per page, likes only
+            models.Index(
+                fields=["target", "-updated_at", "-id"],
+                condition=models.Q(action="like"),
+                name="swipes_likes_received",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.swiper_id} {self.action}d {self.target_id}"
+
+
+class Match(models.Model):
+    """
+    A mutual like, stored once per participant so "my matches" is a single
+    index range scan on (owner, created_at).
+    """
+    owner = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name="matches"
+    )
+    partner = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "matches"
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "partner"], name="unique_match_per_owner"),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "-created_at", "-id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id} matched {self.partner_id}"
+
+
+class DiscoveryPreferences(models.Model):
+    """
+    Who a profile wants to see in find_profiles. Each preference is applied
+    inside the candidate query (see matches.services.preference_filters);
+    left empty, it falls back to the original behaviour: other genders, any
+    age, the requested radius and no required interests.
+    """
+    profile = models.OneToOneField(
+        Profile,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="discovery_preferences"
+    )
+    min_age = models.PositiveSmallIntegerField(null=True, blank=True, validators=[MaxValueValidator(120)])
+    max_age = models.PositiveSmallIntegerField(null=True, blank=True, validators=[MaxValueValidator(120)])
+    genders = ArrayField(
+        models.CharField(max_length=15),
+        default=list,
+        blank=True,
+        help_text="Genders to show; empty shows every gender except the user's own."
+    )
+    max_distance_km = models.FloatField(null=True, blank=True, validators=[MinValueValidator(0.1)])
+    required_interests = ArrayField(
+        models.CharField(max_length=255),
+        default=list,
+        blank=True,
+        help_text="Only show profiles listing all of these interests."
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "discovery_preferences"
+
+    @classmethod
+    def for_profile(cls, profile):
+        """Saved preferences for `profile`, or unsaved defaults."""
+        return cls.objects.filter(profile_id=profile.id).first() or cls(profile_id=profile.id)
+
+    def cap_radius(self, radius_km):
+        if self.max_distance_km is None:
+            return radius_km
+        return min(float(radius_km), self.max_distance_km)
+
+    def __str__(self):
+        return f"Discovery preferences of {self.profile_id}"
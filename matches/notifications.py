@@ -0,0 +1,91 @@
+"""
+Real-time match notifications.
+
+When a swipe completes a mutual like, both profiles get a "match" event on
+their notifications_<profile_id> group, which messaging.consumers
+.NotificationConsumer relays to every socket the user has open. The swipe
+request only hands the event to a background thread once its transaction
+commits; the channel layer round trips and, with MATCHES_CREATE_CHAT_ROOMS,
+the ChatRoom creation happen there, off the request path.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from messaging.models import ChatRoom
+from messaging.services import create_inbox_entries
+
+logger = logging.getLogger(__name__)
+
+_publish_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="match-notify")
+
+
+def notification_group(profile_id):
+    return f"notifications_{profile_id}"
+
+
+def publish_matches(profile_id, partner_ids):
+    """Queue match events for `profile_id` and each of `partner_ids`; never blocks on I/O."""
+    partner_ids = list(partner_ids)
+    if not partner_ids:
+        return
+    matched_at = timezone.now().isoformat()
+    transaction.on_commit(lambda: _publish_executor.submit(_publish, profile_id, partner_ids, matched_at))
+
+
+def _publish(profile_id, partner_ids, matched_at):
+    try:
+        room_ids = {}
+        if settings.MATCHES_CREATE_CHAT_ROOMS:
+            room_ids = ensure_chat_rooms(profile_id, partner_ids)
+
+        messages = []
+        for partner_id in partner_ids:
+            room_id = room_ids.get(partner_id)
+            messages.append((profile_id, partner_id, room_id))
+            messages.append((partner_id, profile_id, room_id))
+        async_to_sync(_send_all)(messages, matched_at)
+    except Exception:
+        logger.exception("Publishing matches for profile %s failed", profile_id)
+    finally:
+        if settings.MATCHES_CREATE_CHAT_ROOMS:
+            connections.close_all()
+
+
+async def _send_all(messages, matched_at):
+    channel_layer = get_channel_layer()
+    await asyncio.gather(*(
+        channel_layer.group_send(notification_group(owner_id), {
+            "type": "match.created",
+            "partner_id": partner_id,
+            "room_id": room_id,
+            "matched_at": matched_at,
+        })
+        for owner_id, partner_id, room_id in messages
+    ))
+
+
+def ensure_chat_rooms(profile_id, partner_ids):
+    """Create the ChatRoom for each pair if missing; return {partner_id: room_id}."""
+    pairs = [(min(profile_id, partner_id), max(profile_id, partner_id)) for partner_id in partner_ids]
+    ChatRoom.objects.bulk_create(
+        [ChatRoom(participant1_id=first, participant2_id=second) for first, second in pairs],
+        ignore_conflicts=True,
+    )
+
+    pair_filter = Q()
+    for first, second in pairs:
+        pair_filter |= Q(participant1_id=first, participant2_id=second)
+    rooms = list(ChatRoom.objects.filter(pair_filter).only("id", "participant1_id", "participant2_id", "created_at"))
+    create_inbox_entries(rooms)
+    return {
+        room.participant2_id if room.participant1_id == profile_id else room.participant1_id: room.id
+        for room in rooms
+    }
@@ -0,0 +1,97 @@
+"""
+Keyset cursors for find_profiles.
+
+A page is the next `limit` cards after the sort key of the last card served:
+(distance, id) when ranking by distance, (-score, distance, id) when ranking
+by interests. The cursor handed to the client is that key plus the origin,
+radius and ranking it was computed for, base64 encoded so clients treat it as
+opaque. A cursor is only honoured for the same origin, radius and ranking;
+after a move the client starts again from the first page.
+"""
+import base64
+import binascii
+import json
+
+from .models import DiscoveryPreferences
+from .ranking import DISTANCE, INTERESTS
+from .services import find_nearby_profiles, find_nearby_profiles_expanding
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def sort_key(card, rank):
+    if rank == INTERESTS:
+        return [-card["score"], card["distance"], card["id"]]
+    return [card["distance"], card["id"]]
+
+
+def encode_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidCursor("Malformed cursor.")
+    if not isinstance(payload, dict) or not isinstance(payload.get("key"), list):
+        raise InvalidCursor("Malformed cursor.")
+    return payload
+
+
+def nearby_page(profile, radius_km, rank=None, limit=DEFAULT_PAGE_SIZE, cursor=None, max_radius_km=None):
+    """
+    Return (cards, next_cursor, radius_km) for one page of find_nearby_profiles.
+
+    One extra card is fetched to tell whether another page exists, so the last
+    page comes back with next_cursor None. Raises InvalidCursor for a cursor
+    that is malformed or was issued for another origin, radius or ranking.
+
+    With `max_radius_km` and no cursor, the first page comes from a ring
+    search (find_nearby_profiles_expanding) and the returned radius is the
+    one it settled on; later pages are requested with that radius.
+    """
+    # Interest ranking falls back to distance for users without interests
+    effective_rank = INTERESTS if rank == INTERESTS and profile.interests else DISTANCE
+    preferences = DiscoveryPreferences.for_profile(profile)
+    radius_km = preferences.cap_radius(radius_km)
+
+    expanded = None
+    if max_radius_km is not None and not cursor:
+        expanded, radius_km = find_nearby_profiles_expanding(
+            profile, limit + 1, radius_km, max_radius_km, preferences=preferences
+        )
+    scope = {
+        "lat": float(profile.latitude),
+        "lon": float(profile.longitude),
+        "radius": float(radius_km),
+        "rank": effective_rank,
+    }
+
+    after = None
+    if cursor:
+        payload = decode_cursor(cursor)
+        if any(payload.get(field) != value for field, value in scope.items()):
+            raise InvalidCursor("Cursor does not match this location, radius or ranking; request the first page again.")
+        after = tuple(payload["key"])
+        if len(after) != (3 if effective_rank == INTERESTS else 2) or not all(
+            isinstance(value, (int, float)) and not isinstance(value, bool) for value in after
+        ):
+            raise InvalidCursor("Malformed cursor.")
+
+    if expanded is not None:
+        cards = expanded
+    else:
+        cards = find_nearby_profiles(
+            profile, radius_km, limit=limit + 1, rank=effective_rank, after=after, preferences=preferences
+        )
+    if len(cards) <= limit:
+        return cards, None, scope["radius"]
+
+    cards = cards[:limit]
+    return cards, encode_cursor({**scope, "key": sort_key(cards[-1], effective_rank)}), scope["radius"]
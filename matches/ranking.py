@@ -0,0 +1,85 @@
+"""
+Interest-aware ranking for swipe decks.
+
+Candidates are prefiltered in the database to those sharing at least one
+interest (GIN index on Profile.interests), with the shared-interest count
+computed in SQL. Distance, Jaccard overlap and the blended score are then
+computed for the whole candidate set in one NumPy pass.
+"""
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Func, IntegerField
+from django.db.models.expressions import RawSQL
+
+from user.geo import RADIUS_OF_EARTH_KM
+
+DISTANCE = "distance"
+INTERESTS = "interests"
+RANKINGS = (DISTANCE, INTERESTS)
+
+
+def with_interest_overlap(queryset, interests):
+    """Keep profiles sharing at least one of `interests`, annotated with overlap counts."""
+    table = queryset.model._meta.db_table
+    return queryset.filter(
+        interests__overlap=interests
+    ).annotate(
+        shared_interests=RawSQL(
+            f'cardinality(ARRAY(SELECT unnest("{table}"."interests") INTERSECT SELECT unnest(%s::varchar[])))',
+            (list(interests),),
+            output_field=IntegerField(),
+        ),
+        interest_count=Func(F("interests"), function="cardinality", output_field=IntegerField()),
+    )
+
+
+def score_candidates(latitude, longitude, radius_km, own_interest_count, rows):
+    """
+    Score (id, latitude, longitude, shared_interests, interest_count) rows.
+
+    Returns (ids, distances, shared, scores) arrays for rows inside `radius_km`.
+    The score blends Jaccard overlap with closeness (1 at the user's location,
+    0 at the radius edge), weighted by MATCHES_INTEREST_WEIGHT.
+    """
+    if not rows:
+        empty = np.zeros(0)
+        return empty.astype(np.int64), empty, empty.astype(np.int64), empty
+
+    ids, lats, lons, shared, counts = (np.asarray(column) for column in zip(*rows))
+    lat = np.radians(lats.astype(np.float64))
+    lon = np.radians(lons.astype(np.float64))
+    lat0 = np.radians(float(latitude))
+    lon0 = np.radians(float(longitude))
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat) * np.sin((lon - lon0) / 2) ** 2
+    distances = np.round(2 * RADIUS_OF_EARTH_KM * np.arcsin(np.sqrt(a)), 2)
+
+    inside = distances <= float(radius_km)
+    ids, distances = ids[inside].astype(np.int64), distances[inside]
+    shared, counts = shared[inside].astype(np.int64), counts[inside].astype(np.int64)
+
+    union = own_interest_count + counts - shared
+    jaccard = np.divide(shared, union, out=np.zeros(len(shared)), where=union > 0)
+    closeness = 1 - distances / float(radius_km)
+    weight = getattr(settings, "MATCHES_INTEREST_WEIGHT", 0.5)
+    scores = np.round(weight * jaccard + (1 - weight) * closeness, 4)
+    return ids, distances, shared, scores
+
+
+def top_by_score(ids, distances, scores, limit=None, after=None):
+    """
+    Indices of the best `limit` candidates: highest score, then nearest, then
+    lowest id. `after` is the (-score, distance, id) key of the last card served.
+    """
+    candidates = np.arange(len(ids))
+    if after is not None:
+        last_neg_score, last_distance, last_id = after
+        neg_scores = -scores
+        later = (neg_scores > last_neg_score) | (
+            (neg_scores == last_neg_score)
+            & ((distances > last_distance) | ((distances == last_distance) & (ids > last_id)))
+        )
+        candidates = candidates[later]
+    if limit is not None and len(candidates) > limit:
+        candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+    order = np.lexsort((ids[candidates], distances[candidates], -scores[candidates]))
+    return candidates[order]
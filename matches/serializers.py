@@ -0,0 +1,44 @@
+from rest_framework import serializers
+
+from user.serializers import ProfileCardSerializer
+from .models import DiscoveryPreferences, Match, Swipe
+
+
+class MatchSerializer(serializers.ModelSerializer):
+    partner = ProfileCardSerializer(read_only=True)
+    matched_at = serializers.DateTimeField(source='created_at', read_only=True)
+
+    class Meta:
+        model = Match
+        fields = ['id', 'partner', 'matched_at']
+
+
+class LikeReceivedSerializer(serializers.ModelSerializer):
+    profile = ProfileCardSerializer(source='swiper', read_only=True)
+    liked_at = serializers.DateTimeField(source='updated_at', read_only=True)
+
+    class Meta:
+        model = Swipe
+        fields = ['id', 'profile', 'liked_at']
+
+
+class DiscoveryPreferencesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DiscoveryPreferences
+        fields = ['min_age', 'max_age', 'genders', 'max_distance_km', 'required_interests', 'updated_at']
+        read_only_fields = ['updated_at']
+        # null clears a list filter like it clears the other fields; it is stored as []
+        extra_kwargs = {
+            'genders': {'allow_null': True},
+            'required_interests': {'allow_null': True},
+        }
+
+    def validate(self, data):
+        for field in ('genders', 'required_interests'):
+            if field in data and data[field] is None:
+                data[field] = []
+        min_age = data.get('min_age', getattr(self.instance, 'min_age', None))
+        max_age = data.get('max_age', getattr(self.instance, 'max_age', None))
+        if min_age is not None and max_age is not None and min_age > max_age:
+            raise serializers.ValidationError({'max_age': "'max_age' must not be below 'min_age'."})
+        return data
@@ -0,0 +1,343 @@
+import math
+import sys
+
+from django.db import connection, transaction
+from django.db.models import Exists, FloatField, OuterRef, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Round, Sin, Sqrt
+from django.utils import timezone
+
+from user.geo import MAX_DISTANCE_KM, RADIUS_OF_EARTH_KM, bounding_box, covering_cells
+from user.models import Profile
+from .deck import CARD_FIELDS, discard_from_deck
+from .engine import get_engine, memory_engine_enabled
+from .models import DiscoveryPreferences, Match, Swipe
+from .notifications import publish_matches
+from .ranking import INTERESTS, score_candidates, top_by_score, with_interest_overlap
+
+
+def preference_filters(profile, preferences):
+    """Candidate predicates for `profile`'s DiscoveryPreferences, as one Q."""
+    if preferences.genders:
+        filters = Q(gender__in=preferences.genders)
+    else:
+        filters = ~Q(gender=profile.gender)
+    if preferences.min_age is not None:
+        filters &= Q(age__gte=preferences.min_age)
+    if preferences.max_age is not None:
+        filters &= Q(age__lte=preferences.max_age)
+    if preferences.required_interests:
+        filters &= Q(interests__contains=preferences.required_interests)
+    return filters
+
+
+def nearby_queryset(profile, radius_km, use_geo_cells=True, preferences=None, inner_km=None):
+    """
+    Profiles inside the bounding box of `radius_km` around `profile` that match
+    its discovery preferences, excluding the profile itself and profiles it has
+    already swiped on. The swipe exclusion is an anti-join on the (swiper,
+    target) unique index, so the query does not grow with swipe history.
+
+    With `use_geo_cells` the box is narrowed to the geohash cells covering it so
+    the lookup goes through a (geo_cell_*, gender, age) index instead of
+    scanning `profiles`; narrower gender and age preferences narrow that scan.
+    Callers that drop everything nearer than `inner_km` pass it so cells
+    entirely inside that distance are left out of the covering.
+    """
+    if preferences is None:
+        preferences = DiscoveryPreferences.for_profile(profile)
+
+    lat_min, lat_max, lon_min, lon_max = bounding_box(profile.latitude, profile.longitude, radius_km)
+
+    potential_matches = Profile.objects.filter(
+        latitude__range=(lat_min, lat_max),
+        longitude__range=(lon_min, lon_max),
+        latitude__isnull=False,
+        longitude__isnull=False
+    )
+
+    if use_geo_cells:
+        precision, cells = covering_cells(profile.latitude, profile.longitude, radius_km, inner_km=inner_km)
+        if cells:
+            potential_matches = potential_matches.filter(**{f"geo_cell_{precision}__in": cells})
+
+    already_swiped = Swipe.objects.filter(swiper=profile, target=OuterRef("pk"))
+
+    return potential_matches.filter(
+        preference_filters(profile, preferences)
+    ).exclude(
+        id=profile.id
+    ).exclude(
+        Exists(already_swiped)
+    )
+
+
+def distance_km(latitude, longitude):
+    """SQL haversine distance in km (2 decimals) from a point to each profile row."""
+    lat0 = math.radians(float(latitude))
+    lon0 = math.radians(float(longitude))
+    lat = Radians(Cast("latitude", FloatField()))
+    lon = Radians(Cast("longitude", FloatField()))
+    a = (
+        Power(Sin((lat - Value(lat0)) / 2), 2)
+        + Value(math.cos(lat0)) * Cos(lat) * Power(Sin((lon - Value(lon0)) / 2), 2)
+    )
+    return Round(Value(2.0 * RADIUS_OF_EARTH_KM) * ASin(Sqrt(a)), 2)
+
+
+def find_nearby_profiles(profile, radius_km, limit=None, rank=None, after=None, preferences=None):
+    """
+    Return the swipe-deck cards within `radius_km` of `profile`, nearest first,
+    or best blended distance/interest score first with rank="interests".
+
+    `after` is the sort key (see matches.pagination.sort_key) of the last card
+    already served; only cards ordered after it are returned. `preferences`
+    defaults to the profile's saved DiscoveryPreferences; their max distance
+    caps `radius_km`.
+    """
+    if preferences is None:
+        preferences = DiscoveryPreferences.for_profile(profile)
+    radius_km = preferences.cap_radius(radius_km)
+    options = {"limit": limit, "after": after, "preferences": preferences}
+
+    if rank == INTERESTS and profile.interests:
+        return find_nearby_profiles_by_interest(profile, radius_km, **options)
+    # The engine snapshot has no interests; required interests need the database
+    if memory_engine_enabled() and not preferences.required_interests:
+        return find_nearby_profiles_in_memory(profile, radius_km, **options)
+    return find_nearby_profiles_in_database(profile, radius_km, **options)
+
+
+RING_GROWTH = 2
+# Past this many rings the last one jumps straight to max_radius_km
+MAX_RINGS = 12
+
+
+def find_nearby_profiles_expanding(profile, count, radius_km, max_radius_km, preferences=None):
+    """
+    Search concentric rings around `profile`: radius_km, then RING_GROWTH times
+    wider, up to max_radius_km, stopping as soon as `count` cards are found.
+    Each ring only reads candidates beyond the previous one, and on the
+    database path its covering leaves out the cells inside that one. Returns the
+    cards, nearest first, and the radius actually searched.
+
+    max_radius_km is clamped to MAX_DISTANCE_KM and at most MAX_RINGS rings
+    are searched, so the number of queries is bounded whatever the inputs.
+    """
+    if not (math.isfinite(radius_km) and math.isfinite(max_radius_km)):
+        raise ValueError("Search radii must be finite.")
+    if preferences is None:
+        preferences = DiscoveryPreferences.for_profile(profile)
+    max_radius_km = min(float(preferences.cap_radius(max_radius_km)), MAX_DISTANCE_KM)
+    radius_km = min(float(radius_km), max_radius_km)
+    cards = []
+    inner_km = None
+    for ring in range(1, MAX_RINGS + 1):
+        # (inner_km, max id) orders after every card at distance <= inner_km
+        after = None if inner_km is None else (inner_km, sys.maxsize)
+        cards += find_nearby_profiles(
+            profile, radius_km, limit=count - len(cards), after=after, preferences=preferences
+        )
+        if len(cards) >= count or radius_km >= max_radius_km:
+            break
+        inner_km = radius_km
+        radius_km = max_radius_km if ring == MAX_RINGS - 1 else min(radius_km * RING_GROWTH, max_radius_km)
+    return cards, radius_km
+
+
+def find_nearby_profiles_in_database(profile, radius_km, use_geo_cells=True, limit=None, after=None,
+                                     preferences=None):
+    """
+    Rank candidates from nearby_queryset by (distance, id) in SQL, so with a
+    `limit` the database keeps only the top rows and nothing else is loaded.
+    Everything nearer than `after`'s distance is skipped, so the geo-cell
+    covering leaves out the cells that lie entirely within it.
+    """
+    candidates = nearby_queryset(
+        profile, radius_km, use_geo_cells=use_geo_cells, preferences=preferences,
+        inner_km=None if after is None else float(after[0]),
+    ).annotate(
+        distance=distance_km(profile.latitude, profile.longitude)
+    ).filter(
+        distance__lte=float(radius_km)
+    )
+
+    if after is not None:
+        last_distance, last_id = after
+        candidates = candidates.filter(Q(distance__gt=last_distance) | Q(distance=last_distance, id__gt=last_id))
+
+    candidates = candidates.order_by("distance", "id").values(*CARD_FIELDS, "distance")
+    if limit is not None:
+        candidates = candidates[:limit]
+
+    nearby_profiles = list(candidates)
+    for card in nearby_profiles:
+        card["distance"] = float(card["distance"])  # numeric on Postgres
+    return nearby_profiles
+
+
+def find_nearby_profiles_in_memory(profile, radius_km, limit=None, after=None, preferences=None):
+    """
+    Same result as find_nearby_profiles_in_database, ranked by the in-process
+    CandidateEngine. Required interests are not supported here.
+
+    Swiped profiles are dropped by the same anti-join nearby_queryset uses,
+    applied to the ids the engine returns, so the cost follows the page size
+    rather than the swipe history. A page short of `limit` after that asks the
+    engine for the next candidates.
+    """
+    if preferences is None:
+        preferences = DiscoveryPreferences.for_profile(profile)
+    engine = get_engine()
+    already_swiped = Swipe.objects.filter(swiper=profile, target=OuterRef("pk"))
+
+    nearby_profiles = []
+    while True:
+        wanted = None if limit is None else limit - len(nearby_profiles)
+        nearest = engine.nearest(
+            profile.latitude,
+            profile.longitude,
+            radius_km,
+            exclude_gender=profile.gender,
+            genders=preferences.genders or None,
+            min_age=preferences.min_age,
+            max_age=preferences.max_age,
+            exclude_ids=[profile.id],
+            limit=wanted,
+            after=after,
+        )
+        cards = {
+            card["id"]: card
+            for card in Profile.objects.filter(
+                id__in=[pk for pk, _ in nearest]
+            ).exclude(
+                Exists(already_swiped)
+            ).values(*CARD_FIELDS)
+        }
+        for profile_id, distance in nearest:
+            card = cards.get(profile_id)
+            if card is not None:
+                card["distance"] = distance
+                nearby_profiles.append(card)
+        if wanted is None or len(nearest) < wanted or len(nearby_profiles) >= limit:
+            return nearby_profiles
+        last_id, last_distance = nearest[-1]
+        after = (last_distance, last_id)
+
+
+def find_nearby_profiles_by_interest(profile, radius_km, limit=None, after=None, preferences=None):
+    """Cards for nearby profiles sharing an interest with `profile`, ranked by matches.ranking."""
+    rows = with_interest_overlap(
+        nearby_queryset(profile, radius_km, preferences=preferences), profile.interests
+    ).values_list("id", "latitude", "longitude", "shared_interests", "interest_count")
+
+    ids, distances, shared, scores = score_candidates(
+        profile.latitude, profile.longitude, radius_km, len(set(profile.interests)), list(rows)
+    )
+    selected = top_by_score(ids, distances, scores, limit=limit, after=after)
+    selected_ids = ids[selected].tolist()
+    cards = {card["id"]: card for card in Profile.objects.filter(id__in=selected_ids).values(*CARD_FIELDS)}
+
+    nearby_profiles = []
+    for index in selected.tolist():
+        card = cards.get(int(ids[index]))
+        if card is not None:
+            card["distance"] = float(distances[index])
+            card["shared_interests"] = int(shared[index])
+            card["score"] = float(scores[index])
+            nearby_profiles.append(card)
+    return nearby_profiles
+
+
+def record_swipe(profile, other_id, action):
+    """
+    Upsert `profile`'s decision on `other_id` and return whether it completes a
+    mutual like, recording the Match if so; a dislike removes any Match between
+    the two. Costs one INSERT .. ON CONFLICT and one lookup or delete on a
+    unique index, independent of swipe history.
+    """
+    Swipe.objects.bulk_create(
+        [Swipe(swiper=profile, target_id=other_id, action=action)],
+        update_conflicts=True,
+        unique_fields=["swiper", "target"],
+        update_fields=["action", "updated_at"],
+    )
+    discard_from_deck(profile.id, [other_id])
+    if action != Swipe.LIKE:
+        remove_matches(profile, [other_id])
+        return False
+    matched = Swipe.objects.filter(swiper_id=other_id, target=profile, action=Swipe.LIKE).exists()
+    if matched:
+        create_matches(profile, [other_id])
+    return matched
+
+
+def record_swipes(profile, swipes):
+    """
+    Persist an ordered list of (other_id, action) pairs in one transaction and
+    return the set of liked ids whose owners already like `profile`, recording
+    a Match for each and removing any Match with a disliked id. When a target
+    appears more than once the last action wins.
+    """
+    final_actions = {}
+    for other_id, action in swipes:
+        final_actions[other_id] = action
+
+    liked_ids = [other_id for other_id, action in final_actions.items() if action == Swipe.LIKE]
+    matched_ids = set()
+    with transaction.atomic():
+        Swipe.objects.bulk_create(
+            [Swipe(swiper=profile, target_id=other_id, action=action) for other_id, action in final_actions.items()],
+            update_conflicts=True,
+            unique_fields=["swiper", "target"],
+            update_fields=["action", "updated_at"],
+        )
+        remove_matches(profile, [other_id for other_id, action in final_actions.items() if action != Swipe.LIKE])
+        if liked_ids:
+            matched_ids = set(
+                Swipe.objects.filter(swiper_id__in=liked_ids, target=profile, action=Swipe.LIKE)
+                .values_list("swiper_id", flat=True)
+            )
+        if matched_ids:
+            # Match events are published once this transaction commits
+            create_matches(profile, matched_ids)
+    # Best effort, outside the transaction: the deck is only a cache
+    discard_from_deck(profile.id, final_actions)
+    return matched_ids
+
+
+def create_matches(profile, partner_ids, notify=True):
+    """
+    Record mutual likes between `profile` and each of `partner_ids`, once per
+    participant, and return the partner ids that were not matched already.
+    Only those are published, and only with `notify`.
+    """
+    partner_ids = list(partner_ids)
+    if not partner_ids:
+        return set()
+    now = timezone.now()
+    rows = []
+    for partner_id in partner_ids:
+        rows += [(profile.id, partner_id, now), (partner_id, profile.id, now)]
+    # bulk_create(ignore_conflicts=True) cannot tell which rows it inserted; RETURNING can
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {Match._meta.db_table} (owner_id, partner_id, created_at) "
+            f"VALUES {', '.join(['(%s, %s, %s)'] * len(rows))} "
+            "ON CONFLICT DO NOTHING RETURNING owner_id, partner_id",
+            [value for row in rows for value in row],
+        )
+        inserted = cursor.fetchall()
+    new_partner_ids = {partner_id for owner_id, partner_id in inserted if owner_id == profile.id}
+    if notify:
+        publish_matches(profile.id, [partner_id for partner_id in partner_ids if partner_id in new_partner_ids])
+    return new_partner_ids
+
+
+def remove_matches(profile, partner_ids):
+    """Delete both participants' Match rows between `profile` and each of `partner_ids`."""
+    partner_ids = list(partner_ids)
+    if not partner_ids:
+        return
+    Match.objects.filter(
+        Q(owner=profile, partner_id__in=partner_ids) | Q(owner_id__in=partner_ids, partner=profile)
+    ).delete()
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from user.models import Profile
+from .deck import refill_if_moved
+from .engine import loaded_engine
+
+
+@receiver(post_save, sender=Profile)
+def update_candidate_engine(sender, instance, **kwargs):
+    engine = loaded_engine()
+    if engine is not None:
+        engine.upsert(instance)
+
+
+@receiver(post_save, sender=Profile)
+def refill_deck_on_move(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "latitude" in update_fields or "longitude" in update_fields:
+        refill_if_moved(instance)
+
+
+@receiver(post_delete, sender=Profile)
+def remove_from_candidate_engine(sender, instance, **kwargs):
+    engine = loaded_engine()
+    if engine is not None:
+        engine.remove(instance.id)
@@ -1,3 +1,460 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from user.geo import MAX_DISTANCE_KM
+from user.models import Profile
+from .models import DiscoveryPreferences, Match, Swipe
+from . import services
+from .services import MAX_RINGS, create_matches, find_nearby_profiles_expanding, record_swipe, record_swipes
+from .views import MAX_SWIPE_BATCH
+
+# Decks and presence use in-process stores here, so the tests need no Redis
+OFFLINE = {
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    "PRESENCE_BACKEND": "local",
+}
+
+
+def create_profile(username, **fields):
+    user = User.objects.create(username=username, password="!")
+    return Profile.objects.create(user=user, name=username, **fields)
+
+
+def match_pairs():
+    return set(Match.objects.values_list("owner_id", "partner_id"))
+
+
+def swipe_actions(swiper):
+    return dict(Swipe.objects.filter(swiper=swiper).values_list("target_id", "action"))
+
+
+@override_settings(**OFFLINE)
+class SwipeTests(TestCase):
+
+    def setUp(self):
+        self.alice = create_profile("alice", gender="female")
+        self.bob = create_profile("bob", gender="male")
+        self.carol = create_profile("carol", gender="male")
+
+    def test_like_back_records_the_match_for_both(self):
+        self.assertFalse(record_swipe(self.alice, self.bob.id, Swipe.LIKE))
+        self.assertEqual(match_pairs(), set())
+
+        self.assertTrue(record_swipe(self.bob, self.alice.id, Swipe.LIKE))
+        self.assertEqual(match_pairs(), {(self.alice.id, self.bob.id), (self.bob.id, self.alice.id)})
+
+    def test_swiping_again_updates_the_one_row(self):
+        record_swipe(self.alice, self.bob.id, Swipe.DISLIKE)
+        record_swipe(self.alice, self.bob.id, Swipe.LIKE)
+        self.assertEqual(swipe_actions(self.alice), {self.bob.id: Swipe.LIKE})
+
+    def test_reports_each_invalid_row_and_applies_the_rest(self):
+        record_swipe(self.bob, self.alice.id, Swipe.LIKE)
+        missing_id = self.bob.id + 1000
+
+        response = self.post([
+            {"other_id": self.alice.id, "action": "like"},
+            {"other_id": missing_id, "action": "like"},
+            {"other_id": self.bob.id, "action": "superlike"},
+            {"other_id": self.bob.id, "action": "like"},
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        results = response.data["results"]
+        self.assertEqual(
+            [(result["other_id"], result["status"]) for result in results],
+            [(self.alice.id, "error"), (missing_id, "error"), (self.bob.id, "error"), (self.bob.id, "success")],
+        )
+        self.assertEqual(results[0]["message"], "Cannot like or dislike yourself")
+        self.assertEqual(results[1]["message"], "Partner profile not found")
+        self.assertTrue(results[3]["match"])
+        self.assertEqual(swipe_actions(self.alice), {self.bob.id: Swipe.LIKE})
+
+    def test_all_valid_rows_return_200(self):
+        response = self.post([{"other_id": self.bob.id, "action": "dislike"}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["match"], False)
+
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        oversized = [{"other_id": self.bob.id, "action": "like"}] * (MAX_SWIPE_BATCH + 1)
+        self.assertEqual(self.post(oversized).status_code, 400)
+        self.assertEqual(swipe_actions(self.alice), {})
+
+
+# Bangalore; 0.01 degrees of latitude is about 1.11 km
+ORIGIN = (12.97, 77.59)
+
+
+def create_nearby_profiles(count, start_km=1, step_km=1, **fields):
+    """`count` male profiles due north of ORIGIN, the first `start_km` away and then every `step_km`."""
+    fields.setdefault("gender", "male")
+    return [
+        create_profile(
+            f"nearby{index}",
+            latitude=round(ORIGIN[0] + (start_km + index * step_km) / 111.045, 6),
+            longitude=ORIGIN[1],
+            **fields,
+        )
+        for index in range(count)
+    ]
+
+
+@override_settings(**OFFLINE)
+class FindProfilesPaginationTests(TestCase):
+
+    def setUp(self):
+        self.seeker = create_profile("seeker", gender="female", latitude=ORIGIN[0], longitude=ORIGIN[1])
+        self.nearby = create_nearby_profiles(5)
+        # Same spot as the third profile: ties are broken by id
+        self.nearby.insert(3, create_profile(
+            "twin", gender="male", latitude=self.nearby[2].latitude, longitude=self.nearby[2].longitude
+        ))
+        self.client = APIClient()
+        self.client.force_authenticate(self.seeker.user)
+
+    def get(self, **params):
+        return self.client.get(reverse("find_profiles"), {"radius": 20, **params})
+
+    def test_pages_cover_every_profile_once_in_order(self):
+        seen, cursor = [], None
+        for _ in range(len(self.nearby)):
+            response = self.get(limit=4, **({"cursor": cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            seen += [card["id"] for card in response.data["nearby_profiles"]]
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [profile.id for profile in self.nearby])
+
+    def test_cursor_is_tied_to_radius_and_location(self):
+        cursor = self.get(limit=2).data["next_cursor"]
+
+        self.assertEqual(self.get(limit=2, radius=30, cursor=cursor).status_code, 400)
+        self.seeker.latitude, self.seeker.longitude = 13.5, 77.59
+        self.seeker.save()
+        self.assertEqual(self.get(limit=2, cursor=cursor).status_code, 400)
+
+    def test_rejects_malformed_cursors(self):
+        for cursor in ("not base64!", "e30=", "eyJrZXkiOiBbInN0cmluZyJdfQ=="):
+            self.assertEqual(self.get(cursor=cursor).status_code, 400, cursor)
+
+    def test_dislike_removes_the_match(self):
+        record_swipe(self.alice, self.bob.id, Swipe.LIKE)
+        record_swipe(self.bob, self.alice.id, Swipe.LIKE)
+
+        self.assertFalse(record_swipe(self.bob, self.alice.id, Swipe.DISLIKE))
+        self.assertEqual(match_pairs(), set())
+
+    def test_batch_keeps_the_last_action_per_target(self):
+        record_swipe(self.bob, self.alice.id, Swipe.LIKE)
+        record_swipe(self.carol, self.alice.id, Swipe.LIKE)
+
+        matched = record_swipes(self.alice, [
+            (self.bob.id, Swipe.DISLIKE),
+            (self.carol.id, Swipe.LIKE),
+            (self.bob.id, Swipe.LIKE),
+            (self.carol.id, Swipe.DISLIKE),
+        ])
+
+        self.assertEqual(matched, {self.bob.id})
+        self.assertEqual(swipe_actions(self.alice), {self.bob.id: Swipe.LIKE, self.carol.id: Swipe.DISLIKE})
+        self.assertEqual(match_pairs(), {(self.alice.id, self.bob.id), (self.bob.id, self.alice.id)})
+
+    def test_batch_dislike_removes_the_match(self):
+        record_swipe(self.alice, self.bob.id, Swipe.LIKE)
+        record_swipe(self.bob, self.alice.id, Swipe.LIKE)
+
+        self.assertEqual(record_swipes(self.alice, [(self.bob.id, Swipe.DISLIKE)]), set())
+        self.assertEqual(match_pairs(), set())
+
+    def test_create_matches_publishes_only_new_matches(self):
+        with mock.patch("matches.services.publish_matches") as publish:
+            self.assertEqual(create_matches(self.alice, [self.bob.id]), {self.bob.id})
+            self.assertEqual(create_matches(self.alice, [self.bob.id, self.carol.id]), {self.carol.id})
+            self.assertEqual(create_matches(self.carol, [self.alice.id]), set())
+
+        self.assertEqual(
+            [call.args for call in publish.call_args_list],
+            [(self.alice.id, [self.bob.id]), (self.alice.id, [self.carol.id]), (self.carol.id, [])],
+        )
+        self.assertEqual(len(match_pairs()), 4)
+
+    def test_batch_rolls_back_when_match_bookkeeping_fails(self):
+        record_swipe(self.bob, self.alice.id, Swipe.LIKE)
+
+        with mock.patch("matches.services.create_matches", side_effect=DatabaseError("deadlock detected")):
+            with self.assertRaises(DatabaseError):
+                record_swipes(self.alice, [(self.bob.id, Swipe.LIKE), (self.carol.id, Swipe.DISLIKE)])
+
+        self.assertEqual(swipe_actions(self.alice), {})
+        self.assertEqual(match_pairs(), set())
+
+
+@override_settings(**OFFLINE)
+class SwipeBatchTests(TestCase):
+
+    def setUp(self):
+        self.alice = create_profile("alice", gender="female")
+        self.bob = create_profile("bob", gender="male")
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice.user)
+
+    def post(self, swipes):
+        return self.client.post(reverse("swipe-batch"), {"swipes": swipes}, format="json")
+
+    def test_rejects_ids_that_are_not_integers(self):
+        response = self.post([
+            {"other_id": True, "action": "like"},
+            {"other_id": self.bob.id + 0.9, "action": "like"},
+            {"other_id": str(self.bob.id), "action": "like"},
+            {"other_id": self.bob.id, "action": "like"},
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["error"] * 3 + ["success"])
+        self.assertEqual(swipe_actions(self.alice), {self.bob.id: Swipe.LIKE})
+
+    def test_reports_each_invalid_row_and_applies_the_rest(self):
+        record_swipe(self.bob, self.alice.id, Swipe.LIKE)
+        missing_id = self.bob.id + 1000
+
+        response = self.post([
+            {"other_id": self.alice.id, "action": "like"},
+            {"other_id": missing_id, "action": "like"},
+            {"other_id": self.bob.id, "action": "superlike"},
+            {"other_id": self.bob.id, "action": "like"},
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        results = response.data["results"]
+        self.assertEqual(
+            [(result["other_id"], result["status"]) for result in results],
+            [(self.alice.id, "error"), (missing_id, "error"), (self.bob.id, "error"), (self.bob.id, "success")],
+        )
+        self.assertEqual(results[0]["message"], "Cannot like or dislike yourself")
+        self.assertEqual(results[1]["message"], "Partner profile not found")
+        self.assertTrue(results[3]["match"])
+        self.assertEqual(swipe_actions(self.alice), {self.bob.id: Swipe.LIKE})
+
+    def test_all_valid_rows_return_200(self):
+        response = self.post([{"other_id": self.bob.id, "action": "dislike"}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["match"], False)
+
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        oversized = [{"other_id": self.bob.id, "action": "like"}] * (MAX_SWIPE_BATCH + 1)
+        self.assertEqual(self.post(oversized).status_code, 400)
+        self.assertEqual(swipe_actions(self.alice), {})
+
+
+# Bangalore; 0.01 degrees of latitude is about 1.11 km
+ORIGIN = (12.97, 77.59)
+
+
+def create_nearby_profiles(count, start_km=1, step_km=1, **fields):
+    """`count` male profiles due north of ORIGIN, the first `start_km` away and then every `step_km`."""
+    fields.setdefault("gender", "male")
+    return [
+        create_profile(
+            f"nearby{index}",
+            latitude=round(ORIGIN[0] + (start_km + index * step_km) / 111.045, 6),
+            longitude=ORIGIN[1],
+            **fields,
+        )
+        for index in range(count)
+    ]
+
+
+@override_settings(**OFFLINE)
+class FindProfilesPaginationTests(TestCase):
+
+    def setUp(self):
+        self.seeker = create_profile("seeker", gender="female", latitude=ORIGIN[0], longitude=ORIGIN[1])
+        self.nearby = create_nearby_profiles(5)
+        # Same spot as the third profile: ties are broken by id
+        self.nearby.insert(3, create_profile(
+            "twin", gender="male", latitude=self.nearby[2].latitude, longitude=self.nearby[2].longitude
+        ))
+        self.client = APIClient()
+        self.client.force_authenticate(self.seeker.user)
+
+    def get(self, **params):
+        return self.client.get(reverse("find_profiles"), {"radius": 20, **params})
+
+    def test_pages_cover_every_profile_once_in_order(self):
+        seen, cursor = [], None
+        for _ in range(len(self.nearby)):
+            response = self.get(limit=4, **({"cursor": cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            seen += [card["id"] for card in response.data["nearby_profiles"]]
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [profile.id for profile in self.nearby])
+
+    def test_cursor_is_tied_to_radius_and_location(self):
+        cursor = self.get(limit=2).data["next_cursor"]
+
+        self.assertEqual(self.get(limit=2, radius=30, cursor=cursor).status_code, 400)
+        self.seeker.latitude, self.seeker.longitude = 13.5, 77.59
+        self.seeker.save()
+        self.assertEqual(self.get(limit=2, cursor=cursor).status_code, 400)
+
+    def test_rejects_malformed_cursors(self):
+        for cursor in ("not base64!", "e30=", "eyJrZXkiOiBbInN0cmluZyJdfQ=="):
+            self.assertEqual(self.get(cursor=cursor).status_code, 400, cursor)
+
+
+@override_settings(**OFFLINE)
+class DeckTests(TestCase):
+
+    def setUp(self):
+        self.alice = create_profile("alice", gender="female", latitude=12.97, longitude=77.59)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice.user)
+
+    def test_rejects_non_finite_radii(self):
+        for radius in ("inf", "-inf", "nan", "0"):
+            with mock.patch("matches.views.next_cards") as next_cards:
+                response = self.client.get(reverse("deck"), {"radius": radius})
+            self.assertEqual(response.status_code, 400, radius)
+            next_cards.assert_not_called()
+
+
+@override_settings(**OFFLINE)
+class ExpandingSearchTests(TestCase):
+
+    def setUp(self):
+        self.seeker = create_profile("seeker", gender="female", latitude=ORIGIN[0], longitude=ORIGIN[1])
+        # 1, 3, 5, 7 and 9 km away
+        self.nearby = create_nearby_profiles(5, step_km=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.seeker.user)
+
+    def test_stops_at_the_first_ring_with_enough_cards(self):
+        cards, radius = find_nearby_profiles_expanding(self.seeker, 2, 2, 100)
+
+        self.assertEqual([card["id"] for card in cards], [profile.id for profile in self.nearby[:2]])
+        self.assertEqual(radius, 4)
+
+    def test_rings_do_not_repeat_inner_cards(self):
+        cards, radius = find_nearby_profiles_expanding(self.seeker, 100, 2, 100)
+
+        self.assertEqual([card["id"] for card in cards], [profile.id for profile in self.nearby])
+        self.assertEqual(radius, 100)
+
+    def test_ring_count_is_bounded_whatever_the_radii(self):
+        with mock.patch.object(services, "find_nearby_profiles", wraps=services.find_nearby_profiles) as search:
+            cards, radius = find_nearby_profiles_expanding(self.seeker, 100, 0.001, 1e300)
+
+        self.assertEqual(search.call_count, MAX_RINGS)
+        self.assertEqual(radius, MAX_DISTANCE_KM)
+        self.assertEqual([card["id"] for card in cards], [profile.id for profile in self.nearby])
+
+    def test_rejects_non_finite_radii(self):
+        for radius, max_radius in ((float("nan"), 10), (1, float("inf"))):
+            with self.assertRaises(ValueError):
+                find_nearby_profiles_expanding(self.seeker, 10, radius, max_radius)
+
+    def test_view_rejects_non_finite_radii(self):
+        for params in ({"radius": "nan"}, {"radius": "inf"}, {"radius": 1, "max_radius": "inf"},
+                       {"radius": 1, "max_radius": "nan"}, {"radius": 0}):
+            response = self.client.get(reverse("find_profiles"), params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_view_clamps_a_huge_max_radius(self):
+        response = self.client.get(reverse("find_profiles"), {"radius": 1, "max_radius": "1e300", "limit": 10})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["radius"], MAX_DISTANCE_KM)
+        self.assertEqual([card["id"] for card in response.data["nearby_profiles"]], [p.id for p in self.nearby])
+
+
+@override_settings(**OFFLINE)
+class DiscoveryPreferencesTests(TestCase):
+
+    def setUp(self):
+        self.seeker = create_profile("seeker", gender="female", latitude=ORIGIN[0], longitude=ORIGIN[1])
+        self.client = APIClient()
+        self.client.force_authenticate(self.seeker.user)
+
+    def save(self, method, data):
+        with mock.patch("matches.views.clear_deck") as clear_deck:
+            response = getattr(self.client, method)(reverse("discovery-preferences"), data, format="json")
+        if response.status_code == 200:
+            clear_deck.assert_called_once_with(self.seeker.id)
+        return response
+
+    def stored(self):
+        preferences = DiscoveryPreferences.objects.get(profile=self.seeker)
+        return (preferences.min_age, preferences.max_age, preferences.genders,
+                preferences.max_distance_km, preferences.required_interests)
+
+    def test_get_returns_defaults_before_anything_is_saved(self):
+        response = self.client.get(reverse("discovery-preferences"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {field: response.data[field] for field in ("min_age", "max_age", "genders", "required_interests")},
+            {"min_age": None, "max_age": None, "genders": [], "required_interests": []},
+        )
+        self.assertFalse(DiscoveryPreferences.objects.exists())
+
+    def test_put_replaces_and_patch_updates(self):
+        response = self.save("put", {
+            "min_age": 25, "max_age": 35, "genders": ["male"], "max_distance_km": 5, "required_interests": ["hiking"],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stored(), (25, 35, ["male"], 5, ["hiking"]))
+
+        self.assertEqual(self.save("patch", {"max_age": 40}).status_code, 200)
+        self.assertEqual(self.stored(), (25, 40, ["male"], 5, ["hiking"]))
+
+    def test_null_clears_the_list_preferences(self):
+        self.save("put", {"genders": ["male"], "required_interests": ["hiking"]})
+
+        response = self.save("patch", {"genders": None, "required_interests": None})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["genders"], response.data["required_interests"]), ([], []))
+        self.assertEqual(self.stored()[2::2], ([], []))
+
+    def test_rejects_an_inverted_age_range(self):
+        self.save("put", {"min_age": 30})
+        response = self.save("patch", {"max_age": 20})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored()[:2], (30, None))
+
+    def test_preferences_filter_the_candidates(self):
+        # 1, 2, 3 and 4 km away
+        too_young, wrong_gender, no_interest, wanted = [
+            create_profile(username, latitude=round(ORIGIN[0] + km / 111.045, 6), longitude=ORIGIN[1], **fields)
+            for km, (username, fields) in enumerate([
+                ("too_young", {"gender": "male", "age": 20, "interests": ["hiking"]}),
+                ("wrong_gender", {"gender": "other", "age": 30, "interests": ["hiking"]}),
+                ("no_interest", {"gender": "male", "age": 30, "interests": ["chess"]}),
+                ("wanted", {"gender": "male", "age": 30, "interests": ["hiking", "chess"]}),
+            ], start=1)
+        ]
+        far = create_nearby_profiles(1, start_km=8, gender="male", age=30, interests=["hiking"])[0]
+
+        def found():
+            response = self.client.get(reverse("find_profiles"), {"radius": 20})
+            self.assertEqual(response.status_code, 200)
+            return [card["id"] for card in response.data["nearby_profiles"]]
+
+        self.assertEqual(found(), [too_young.id, wrong_gender.id, no_interest.id, wanted.id, far.id])
+        self.save("put", {
+            "min_age": 25, "genders": ["male"], "required_interests": ["hiking"], "max_distance_km": 5,
+        })
+        self.assertEqual(found(), [wanted.id])
@@ -3,5 +3,10 @@ from . import views
 
 urlpatterns = [
     path('get', views.find_profiles, name='find_profiles'),
-    path('swipe',views.updateList, name= 'Update List')
+    path('swipe',views.updateList, name= 'Update List'),
+    path('swipe/batch', views.swipe_batch, name='swipe-batch'),
+    path('matches', views.match_list, name='match-list'),
+    path('likes', views.likes_received, name='likes-received'),
+    path('preferences', views.discovery_preferences, name='discovery-preferences'),
+    path('deck', views.deck, name='deck')
 ]
@@ -4,28 +4,19 @@ from rest_framework import status
 import math
 from rest_framework.decorators import api_view, permission_classes # Import permissions
 from rest_framework.permissions import IsAuthenticated             # Import IsAuthenticated
+from rest_framework.pagination import CursorPagination
 from user.models import Profile
+from user.presence import get_presence
+from user.serializers import ProfileCardSerializer
+from .deck import clear_deck, next_cards
+from .models import DiscoveryPreferences, Match, Swipe
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, nearby_page
+from .ranking import INTERESTS, RANKINGS
+from .serializers import DiscoveryPreferencesSerializer, LikeReceivedSerializer, MatchSerializer
+from .services import record_swipe, record_swipes
 import traceback
 from django.db.models import Q # For complex lookups
 import decimal # For high-precision math
-import decimal
-
-# The haversine function is good. No changes needed.
-def haversine(lat1, lon1, lat2, lon2):
-    """
-    Calculate the great-circle distance between two points on the Earth (specified in decimal degrees).
-    Returns the distance in kilometers.
-    """
-    # Convert latitude and longitude from degrees to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
-
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    radius_of_earth_km = 6371  # Radius of Earth in kilometers
-    return round(c * radius_of_earth_km, 2)
 
 # -----------------------------------------------------------------
 # OPTIMIZED `updateList`
@@ -55,7 +46,7 @@ def updateList(request):
 
         # Fetch the partner's profile
         try:
-            partner_profile = Profile.objects.get(id=other_id)
+            partner_profile = Profile.objects.only('id', 'name').get(id=other_id)
         except Profile.DoesNotExist:
             return Response(
                 {"status": "error", "message": "Partner profile not found"}, 
@@ -68,25 +59,10 @@ def updateList(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        match = False  # Default match state
+        # Swipes live in matches.Swipe; the like/dislike arrays are no longer written
+        match = record_swipe(user_profile, other_id, action)
 
         if action == "like":
-            # OPTIMIZATION: Removed redundant 'isinstance(..., list)' check.
-            # Your ArrayField(default=list) guarantees it's a list.
-            
-            # Check if the other user has *already* liked this user
-            if user_profile.id in partner_profile.like:
-                match = True
-                # You might want to create a "Match" object here
-            
-            # Add to user's like list if not already present
-            if other_id not in user_profile.like:
-                user_profile.like.append(other_id)
-                # Also remove from dislike list if it's there
-                if other_id in user_profile.dislike:
-                    user_profile.dislike.remove(other_id)
-                user_profile.save(update_fields=["like", "dislike"])
-
             response_data = {
                 "name": partner_profile.name,
                 "status": "success",
@@ -96,13 +72,6 @@ def updateList(request):
             return Response(response_data, status=status.HTTP_200_OK)
 
         elif action == "dislike":
-            if other_id not in user_profile.dislike:
-                user_profile.dislike.append(other_id)
-                # Also remove from like list if it's there
-                if other_id in user_profile.like:
-                    user_profile.like.remove(other_id)
-                user_profile.save(update_fields=["dislike", "like"])
-
             response_data = {
                 "name": partner_profile.name,
                 "status": "success",
@@ -119,9 +88,89 @@ def updateList(request):
         )
 
 
+MAX_SWIPE_BATCH = 100
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def swipe_batch(request):
+    """
+    Apply a burst of swipes in order: {"swipes": [{"other_id": 5, "action": "like"}, ...]}.
+    Targets are validated with one query, valid swipes are written in one
+    transaction and matches come from one reciprocal-like query.
+    """
+    try:
+        user_profile = request.user.profile
+
+        entries = request.data.get('swipes')
+        if not isinstance(entries, list) or not entries:
+            return Response(
+                {"status": "error", "message": "'swipes' must be a non-empty list"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(entries) > MAX_SWIPE_BATCH:
+            return Response(
+                {"status": "error", "message": f"At most {MAX_SWIPE_BATCH} swipes per batch"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        parsed = []
+        for entry in entries:
+            # JSON true or 1.9 would pass int(); only real integers are ids
+            other_id = entry.get('other_id') if isinstance(entry, dict) else None
+            if not isinstance(other_id, int) or isinstance(other_id, bool):
+                parsed.append((None, None, "'other_id' must be a valid integer"))
+                continue
+            action = entry.get('action')
+            if action not in ["like", "dislike"]:
+                parsed.append((other_id, action, "Missing or invalid 'action' (must be 'like' or 'dislike')"))
+            elif other_id == user_profile.id:
+                parsed.append((other_id, action, "Cannot like or dislike yourself"))
+            else:
+                parsed.append((other_id, action, None))
+
+        requested_ids = {other_id for other_id, _, error in parsed if error is None}
+        existing_ids = set(Profile.objects.filter(id__in=requested_ids).values_list('id', flat=True))
+
+        valid = []
+        for other_id, action, error in parsed:
+            if error is None and other_id in existing_ids:
+                valid.append((other_id, action))
+
+        matched_ids = record_swipes(user_profile, valid) if valid else set()
+
+        results = []
+        for other_id, action, error in parsed:
+            if error is None and other_id not in existing_ids:
+                error = "Partner profile not found"
+            if error:
+                results.append({"other_id": other_id, "status": "error", "message": error})
+            else:
+                results.append({
+                    "other_id": other_id,
+                    "action": action,
+                    "status": "success",
+                    "match": action == "like" and other_id in matched_ids,
+                })
+
+        status_code = status.HTTP_207_MULTI_STATUS if len(valid) < len(parsed) else status.HTTP_200_OK
+        return Response({"status": "success", "results": results}, status=status_code)
+
+    except Exception as e:
+        traceback.print_exc()
+        return Response(
+            {"status": "error", "message": "An internal server error occurred"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def find_profiles(request):
+    """
+    One page of nearby profiles. Pass `limit` (default 20, max 100) and the
+    previous response's `next_cursor` as `cursor` to read the next page.
+    """
     try:
         current_profile = request.user.profile
         
@@ -135,61 +184,69 @@ def find_profiles(request):
         try:
             # 1. Get the radius as a Decimal, not a float
             radius_km = decimal.Decimal(request.query_params.get('radius', 10))
+            if not radius_km.is_finite():
+                raise ValueError
         except (ValueError, TypeError, decimal.InvalidOperation):
             return Response(
                 {"error": "'radius' must be a valid number."}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         # --- END FIX ---
+        if radius_km <= 0:
+            return Response({"error": "'radius' must be positive."}, status=status.HTTP_400_BAD_REQUEST)
 
-        current_lat = current_profile.latitude
-        current_lon = current_profile.longitude
+        rank = request.query_params.get('rank')
+        if rank is not None and rank not in RANKINGS:
+            return Response(
+                {"error": f"'rank' must be one of: {', '.join(RANKINGS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_PAGE_SIZE))
+        except (ValueError, TypeError):
+            return Response({"error": "'limit' must be a valid integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            return Response(
+                {"error": f"'limit' must be between 1 and {MAX_PAGE_SIZE}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        max_radius_km = request.query_params.get('max_radius')
+        if max_radius_km is not None:
+            try:
+                max_radius_km = decimal.Decimal(max_radius_km)
+                if not max_radius_km.is_finite():
+                    raise ValueError
+            except (ValueError, TypeError, decimal.InvalidOperation):
+                return Response({"error": "'max_radius' must be a valid number."}, status=status.HTTP_400_BAD_REQUEST)
+            if max_radius_km < radius_km:
+                return Response(
+                    {"error": "'radius' must be no larger than 'max_radius'."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if rank == INTERESTS:
+                return Response(
+                    {"error": "'max_radius' only applies to distance ranking."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        # Candidates come from the geo-cell index, see matches.services
+        try:
+            nearby_profiles, next_cursor, radius_used = nearby_page(
+                current_profile, radius_km, rank=rank, limit=limit, cursor=request.query_params.get('cursor'),
+                max_radius_km=max_radius_km,
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 2. Now all calculations are Decimal-based
-        lat_change = radius_km / decimal.Decimal('111.045')
-        
-        # 3. Handle the 'cos' function, which needs a float but must return a Decimal
-        cos_lat = decimal.Decimal(math.cos(math.radians(float(current_lat))))
-        lon_change = radius_km / (decimal.Decimal('111.045') * cos_lat)
-        
-        lat_min = current_lat - lat_change
-        lat_max = current_lat + lat_change
-        lon_min = current_lon - lon_change
-        lon_max = current_lon + lon_change
-        
-        seen_ids = set(current_profile.like) | set(current_profile.dislike)
-        seen_ids.add(current_profile.id)
-
-        potential_matches = Profile.objects.filter(
-            latitude__range=(lat_min, lat_max),
-            longitude__range=(lon_min, lon_max),
-            latitude__isnull=False,
-            longitude__isnull=False
-        ).exclude(
-            id__in=seen_ids
-        ).exclude(
-            gender=current_profile.gender
-        )
-        
-        nearby_profiles = []
-        for profile in potential_matches:
-            distance = haversine(current_lat, current_lon, profile.latitude, profile.longitude)
-            print(f"Checking Profile ID: {profile.id}, Distance: {distance}, Radius: {radius_km}")
-            if distance <= radius_km:
-                nearby_profiles.append({
-                    "id": profile.id,
-                    "name": profile.name,
-                    "gender": profile.gender,
-                    "age": profile.age, 
-                    "distance": distance,
-                    "profile_picture": profile.profile_picture,
-                    "about": profile.about,
-                })
-        
-        nearby_profiles.sort(key=lambda p: p["distance"])
-        
         return Response(
-            {"total_profiles": len(nearby_profiles), "nearby_profiles": nearby_profiles},
+            {
+                "total_profiles": len(nearby_profiles),
+                "nearby_profiles": nearby_profiles,
+                "radius": radius_used,
+                "next_cursor": next_cursor,
+            },
             status=status.HTTP_200_OK
         )
 
@@ -203,4 +260,113 @@ def find_profiles(request):
         return Response(
             {"error": f"An unexpected error occurred: {str(e)}"}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+
+class MatchPagination(CursorPagination):
+    # Cursor pagination skips the COUNT query, so each page is a single indexed query
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def match_list(request):
+    """The current user's matches, newest first, with each partner's compact card."""
+    matches = Match.objects.filter(
+        owner_id=request.user.profile.id
+    ).select_related('partner').only(
+        'id', 'created_at', *[f'partner__{field}' for field in ProfileCardSerializer.Meta.fields]
+    )
+
+    paginator = MatchPagination()
+    page = paginator.paginate_queryset(matches, request)
+    serializer = MatchSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+
+class LikesReceivedPagination(MatchPagination):
+    ordering = ('-updated_at', '-id')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def likes_received(request):
+    """Profiles that currently like the user, most recent first, read from the swipes_likes_received index."""
+    likes = Swipe.objects.filter(
+        target_id=request.user.profile.id, action=Swipe.LIKE
+    ).select_related('swiper').only(
+        'id', 'updated_at', *[f'swiper__{field}' for field in ProfileCardSerializer.Meta.fields]
+    )
+
+    paginator = LikesReceivedPagination()
+    page = paginator.paginate_queryset(likes, request)
+    serializer = LikeReceivedSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(['GET', 'PUT', 'PATCH'])
+@permission_classes([IsAuthenticated])
+def discovery_preferences(request):
+    """Read or update who find_profiles and the swipe deck show the user."""
+    current_profile = request.user.profile
+    preferences = DiscoveryPreferences.for_profile(current_profile)
+
+    if request.method == 'GET':
+        serializer = DiscoveryPreferencesSerializer(preferences)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    serializer = DiscoveryPreferencesSerializer(preferences, data=request.data, partial=request.method == 'PATCH')
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+    # The cached deck was ranked with the old preferences
+    clear_deck(current_profile.id)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+MAX_DECK_CARDS = 50
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def deck(request):
+    """Next `count` cards from the user's precomputed deck (see matches.deck)."""
+    try:
+        current_profile = request.user.profile
+
+        if current_profile.latitude is None or current_profile.longitude is None:
+            return Response(
+                {"error": "Your profile is missing location data. Please update your location."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            count = int(request.query_params.get('count', 10))
+            radius_km = float(request.query_params.get('radius', 10))
+            if not math.isfinite(radius_km):
+                raise ValueError
+        except (ValueError, TypeError):
+            return Response(
+                {"error": "'count' and 'radius' must be valid numbers."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 < count <= MAX_DECK_CARDS or radius_km <= 0:
+            return Response(
+                {"error": f"'count' must be between 1 and {MAX_DECK_CARDS} and 'radius' positive."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cards, remaining = next_cards(current_profile, count, radius_km)
+        online = get_presence().online([card['id'] for card in cards])
+        for card in cards:
+            card['online'] = card['id'] in online
+        return Response({"cards": cards, "remaining": remaining}, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        traceback.print_exc()
+        return Response(
+            {"error": f"An unexpected error occurred: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
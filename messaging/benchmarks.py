@@ -0,0 +1,115 @@
+"""Helpers shared by the messaging WebSocket benchmark and load-test management commands."""
+import asyncio
+import contextlib
+import json
+import time
+from unittest import mock
+
+from channels.layers import channel_layers
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.db.backends.utils import CursorWrapper
+from rest_framework_simplejwt.tokens import AccessToken
+
+from user.identity import invalidate_identity
+from .models import ChatRoom
+from .services import create_inbox_entries, invalidate_room_participants
+
+CONNECT_CONCURRENCY = 100
+# Handshakes queue behind each other on the database thread; the testing default of 1s is too short
+SOCKET_TIMEOUT_SECONDS = 30
+
+
+def use_in_memory_channel_layer(capacity=10000):
+    """Point this process's channel layer at InMemoryChannelLayer so runs need no Redis."""
+    settings.CHANNEL_LAYERS = {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer", "CONFIG": {"capacity": capacity}},
+    }
+    channel_layers.backends.clear()
+
+
+@contextlib.contextmanager
+def count_queries():
+    """Count SQL statements run on any thread inside the block; yields a one-item list."""
+    count = [0]
+
+    def counted(method):
+        def wrapper(self, *args, **kwargs):
+            count[0] += 1
+            return method(self, *args, **kwargs)
+        return wrapper
+
+    with mock.patch.object(CursorWrapper, "execute", counted(CursorWrapper.execute)), \
+            mock.patch.object(CursorWrapper, "executemany", counted(CursorWrapper.executemany)):
+        yield count
+
+
+def seed_chat_rooms(profiles, rooms_per_profile):
+    """
+    Open rooms between each profile and the next rooms_per_profile // 2
+    around a ring, so every profile is in about rooms_per_profile rooms.
+    Returns the rooms, with inbox rows created for them.
+    """
+    half = max(1, rooms_per_profile // 2)
+    pairs = {
+        tuple(sorted((profile.id, profiles[(i + step) % len(profiles)].id)))
+        for i, profile in enumerate(profiles)
+        for step in range(1, half + 1)
+    }
+    ChatRoom.objects.bulk_create(
+        [ChatRoom(participant1_id=a, participant2_id=b) for a, b in pairs if a != b], ignore_conflicts=True
+    )
+    ids = [profile.id for profile in profiles]
+    rooms = list(ChatRoom.objects.filter(participant1_id__in=ids, participant2_id__in=ids))
+    create_inbox_entries(rooms)
+    return rooms
+
+
+def access_tokens(profiles):
+    return {profile.id: str(AccessToken.for_user(profile.user)) for profile in profiles}
+
+
+def forget_cached_identities(profiles, rooms):
+    """Drop cached handshake lookups so each run starts cold."""
+    for profile in profiles:
+        invalidate_identity(profile.user_id)
+    for room in rooms:
+        invalidate_room_participants(room.id)
+
+
+async def open_sockets(application, paths, concurrency=CONNECT_CONCURRENCY):
+    """Connect a WebsocketCommunicator per path, `concurrency` at a time; returns them in order."""
+    sockets = []
+    for start in range(0, len(paths), concurrency):
+        chunk = [WebsocketCommunicator(application, path) for path in paths[start:start + concurrency]]
+        results = await asyncio.gather(*(socket.connect(timeout=SOCKET_TIMEOUT_SECONDS) for socket in chunk))
+        for path, (connected, _) in zip(paths[start:start + concurrency], results):
+            if not connected:
+                raise RuntimeError(f"Handshake rejected for {path}")
+        sockets.extend(chunk)
+    return sockets
+
+
+async def close_sockets(sockets, concurrency=CONNECT_CONCURRENCY):
+    for start in range(0, len(sockets), concurrency):
+        await asyncio.gather(*(
+            socket.disconnect(timeout=SOCKET_TIMEOUT_SECONDS) for socket in sockets[start:start + concurrency]
+        ))
+
+
+async def receive_frames(socket, count, timeout=30):
+    """
+    Up to `count` JSON frames from `socket`, waiting at most `timeout`
+    seconds in total. Reads the communicator's queue directly: a timed out
+    receive_json_from() would cancel the consumer.
+    """
+    frames = []
+    deadline = time.monotonic() + timeout
+    while len(frames) < count:
+        try:
+            message = await asyncio.wait_for(socket.output_queue.get(), max(0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            break
+        if message["type"] == "websocket.send" and message.get("text") is not None:
+            frames.append(json.loads(message["text"]))
+    return frames
@@ -1,110 +1,515 @@
-import json
+import asyncio
+import time
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import ChatRoom, Message, Profile
-from django.contrib.auth.models import User
+from django.conf import settings
+from django.db import transaction
+from .frames import FrameCodecMixin, decode_frame, encode_event
+from .models import ChatRoom, InboxEntry, Message, Profile
+from .pagination import newer_messages
+from .services import mark_read, read_receipt_event, record_message, room_group_name, room_participants
+from .writer import get_message_writer, write_behind_enabled
+from matches.notifications import notification_group
+from user.presence import get_presence
 
-class ChatConsumer(AsyncWebsocketConsumer):
+# A connection reports activity to the presence store at most this often
+HEARTBEAT_INTERVAL_SECONDS = 15
+# Ephemeral frames never touch the database; per connection and room, an
+# unchanged typing state is re-broadcast at most every TYPING_REFRESH_SECONDS
+# (so clients can expire a stale indicator) and seen receipts at most every
+# SEEN_INTERVAL_SECONDS, coalesced to the newest message id
+TYPING_REFRESH_SECONDS = 3
+SEEN_INTERVAL_SECONDS = 1
+# Missed messages are replayed on reconnect in frames of this many
+CATCH_UP_BATCH_SIZE = 100
+CATCH_UP_FIELDS = ('id', 'sender_id', 'message', 'timestamp')
 
-    async def connect(self):
-        self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group_name = f'chat_{self.room_id}'
-        self.user = self.scope.get('user')
 
-        if not self.user or not self.user.is_authenticated:
-            await self.close()
-            return
+@database_sync_to_async
+def get_profile_id(user):
+    if hasattr(user, 'profile_id'):
+        return user.profile_id  # resolved by TokenAuthMiddleware
+    return Profile.objects.filter(user=user).values_list('id', flat=True).first()
 
-        is_participant = await self.check_participation()
-        if not is_participant:
-            await self.close()
+
+def last_seen_id_param(scope):
+    last_seen_id = parse_qs(scope.get('query_string', b'').decode()).get('last_seen_id', [None])[0]
+    if last_seen_id is not None and last_seen_id.isdigit():
+        return int(last_seen_id)
+    return None
+
+
+class PresenceMixin:
+    """Connect/disconnect/heartbeat presence reporting for a consumer with a profile_id."""
+    presence_profile_id = None
+    _last_heartbeat = 0.0
+
+    async def presence_connect(self, profile_id):
+        self.presence_profile_id = profile_id
+        self._last_heartbeat = time.monotonic()
+        await sync_to_async(get_presence().connect, thread_sensitive=False)(profile_id)
+
+    async def presence_disconnect(self):
+        if self.presence_profile_id is not None:
+            await sync_to_async(get_presence().disconnect, thread_sensitive=False)(self.presence_profile_id)
+
+    async def presence_heartbeat(self):
+        now = time.monotonic()
+        if self.presence_profile_id is None or now - self._last_heartbeat < HEARTBEAT_INTERVAL_SECONDS:
             return
+        self._last_heartbeat = now
+        await sync_to_async(get_presence().heartbeat, thread_sensitive=False)(self.presence_profile_id)
 
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
-        await self.accept()
 
-    async def disconnect(self, close_code):
+class MatchEventsMixin:
+    """Forwards match events from matches.notifications to the user's socket."""
+
+    async def match_created(self, event):
+        await self.send_payload({
+            'event': 'match',
+            'partner_id': event.get('partner_id'),
+            'room_id': event.get('room_id'),
+            'matched_at': event.get('matched_at'),
+        })
+
+
+class RoomSubscription:
+    """One room a socket has joined, with that room's per-connection ephemeral state."""
+
+    def __init__(self, room):
+        self.room = room
+        self.group_name = room_group_name(room.id)
+        self.typing = False
+        self.typing_sent_at = 0.0
+        self.seen_up_to = None
+        self.seen_sent_at = 0.0
+        self.seen_flush = None
+        # Ids catch_up sent (at most MESSAGING_CATCH_UP_LIMIT); live copies of
+        # those messages are skipped. Ids are not in send order (writers reserve
+        # them in blocks), so anything not replayed is still delivered
+        self.replayed_ids = set()
+
+
+class RoomEventsConsumer(FrameCodecMixin, PresenceMixin, AsyncWebsocketConsumer):
+    """
+    Chat in any number of rooms over one socket. Inbound frames name their
+    room with `room_id` and every room event sent out carries it; frames for
+    rooms the socket has not joined are ignored.
+    """
+    profile_id = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.subscriptions = {}
+
+    async def authenticate(self):
+        self.user = self.scope.get('user')
+        if not self.user or not self.user.is_authenticated:
+            return False
+        self.profile_id = await get_profile_id(self.user)
+        return self.profile_id is not None
+
+    async def join(self, room_id):
+        """Subscribe to a room the user is in; returns its RoomSubscription, or None."""
+        if room_id in self.subscriptions:
+            return self.subscriptions[room_id]
+        room = await self.participant_room(room_id)
+        if room is None:
+            return None
+        return await self.add_subscription(room)
+
+    async def add_subscription(self, room):
+        subscription = RoomSubscription(room)
+        self.subscriptions[room.id] = subscription
+        await self.channel_layer.group_add(subscription.group_name, self.channel_name)
+        return subscription
+
+    async def leave(self, room_id):
+        subscription = self.subscriptions.pop(room_id, None)
+        if subscription is None:
+            return
+        if subscription.seen_flush is not None:
+            subscription.seen_flush.cancel()
+        if subscription.typing:
+            await self.receive_typing(subscription, False)
         try:
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
-            )
+            await self.channel_layer.group_discard(subscription.group_name, self.channel_name)
         except Exception as e:
             print(f"Error during group_discard: {e}")
 
-    async def receive(self, text_data):
+    async def disconnect(self, close_code):
+        await self.presence_disconnect()
+        for room_id in list(self.subscriptions):
+            await self.leave(room_id)
+        if write_behind_enabled():
+            # Messages this connection sent are committed before the disconnect completes
+            await get_message_writer().flush()
+
+    async def catch_up(self, subscription, last_seen_id):
+        """
+        Replay the room's messages after `last_seen_id` in batches, then send
+        "caught_up". The socket already belongs to the room group, so live
+        messages queue up behind the replay; any that were replayed are
+        skipped when they arrive. `complete` is false when the anchor is
+        not in this room or the gap is over MESSAGING_CATCH_UP_LIMIT, and the
+        client should page through message_list instead.
+        """
+        if write_behind_enabled():
+            await get_message_writer().flush()
+        room = subscription.room
+        limit = settings.MESSAGING_CATCH_UP_LIMIT
+        anchor = await self.message_position(room, last_seen_id)
+        replayed = 0
+        complete = anchor is not None
+        while anchor is not None:
+            size = min(CATCH_UP_BATCH_SIZE, limit - replayed)
+            # One extra row tells whether more remain after this batch
+            rows = await self.missed_messages(room, anchor, size + 1)
+            batch = rows[:size]
+            if batch:
+                await self.send_payload({
+                    'event': 'missed',
+                    'room_id': room.id,
+                    'fields': CATCH_UP_FIELDS,
+                    'messages': [[message_id, sender_id, content, timestamp.isoformat()]
+                                 for message_id, sender_id, content, timestamp in batch],
+                })
+                replayed += len(batch)
+                last_seen_id = batch[-1][0]
+                subscription.replayed_ids.update(m[0] for m in batch)
+                anchor = (batch[-1][3], batch[-1][0])
+            if len(rows) <= size:
+                break
+            if replayed >= limit:
+                complete = False
+                break
+        await self.send_payload({
+            'event': 'caught_up', 'room_id': room.id, 'last_id': last_seen_id,
+            'replayed': replayed, 'complete': complete,
+        })
+
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
-            message_content = data.get('message')
+            await self.presence_heartbeat()
+            await self.receive_frame(decode_frame(text_data, bytes_data))
+        except ValueError:
+            print(f"WebSocket received an invalid frame: {text_data if bytes_data is None else bytes_data!r}")
+        except Exception as e:
+            print(f"Error processing received WebSocket message: {e}")
 
-            if not message_content or not self.user or not self.user.is_authenticated:
-                return
+    async def receive_frame(self, data):
+        # {"type": "read" | "seen", "up_to": <message id>}, {"type": "typing" | "stopped_typing"};
+        # any other frame is a chat message
+        subscription = self.subscriptions.get(data.get('room_id'))
+        if subscription is None:
+            return
+        frame_type = data.get('type')
+        if frame_type == 'read':
+            await self.receive_read(subscription, data.get('up_to'))
+        elif frame_type in ('typing', 'stopped_typing'):
+            await self.receive_typing(subscription, frame_type == 'typing')
+        elif frame_type == 'seen':
+            await self.receive_seen(subscription, data.get('up_to'))
+        else:
+            await self.receive_message(subscription, data.get('message'))
 
-            message_instance = await self.save_message(message_content)
+    async def receive_message(self, subscription, message_content):
+        if not message_content:
+            return
+        room = subscription.room
 
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'chat_message',
+        if write_behind_enabled():
+            message_instance = await get_message_writer().submit(
+                room.id, self.user, self.profile_id, message_content
+            )
+        else:
+            message_instance = await self.save_message(room, message_content)
+        # Receiving a message clears the sender's typing indicator on the client
+        subscription.typing = False
+
+        # Encoded once here; every recipient forwards the bytes for its format
+        await self.channel_layer.group_send(
+            subscription.group_name,
+            {
+                'type': 'chat_message',
+                'room_id': room.id,
+                'id': message_instance.id,
+                'frames': encode_event({
+                    'room_id': room.id,
                     'id': message_instance.id,
                     'message': message_instance.content,
                     'sender_id': self.user.id,
                     'sender_username': self.user.username,
                     'timestamp': message_instance.timestamp.isoformat()
-                }
+                }),
+            }
+        )
+
+    async def receive_read(self, subscription, up_to):
+        if not isinstance(up_to, int):
+            return
+        if write_behind_enabled():
+            # The message being acknowledged may still be waiting in the writer
+            await get_message_writer().flush()
+        room = subscription.room
+        result = await self.save_read(room, up_to)
+        if result is None:
+            return
+        marked, read_at, unread_count = result
+        await self.send_payload(
+            {'event': 'unread', 'room_id': room.id, 'unread_count': unread_count}, key=('unread', room.id)
+        )
+        if marked:
+            await self.channel_layer.group_send(
+                subscription.group_name, read_receipt_event(room.id, self.profile_id, up_to, read_at)
             )
 
-        except json.JSONDecodeError:
-            print(f"WebSocket received invalid JSON: {text_data}")
-        except Exception as e:
-            print(f"Error processing received WebSocket message: {e}")
+    async def receive_typing(self, subscription, typing):
+        now = time.monotonic()
+        if typing == subscription.typing and (not typing or now - subscription.typing_sent_at < TYPING_REFRESH_SECONDS):
+            return
+        subscription.typing = typing
+        subscription.typing_sent_at = now
+        room_id = subscription.room.id
+        await self.channel_layer.group_send(subscription.group_name, {
+            'type': 'typing_state',
+            'room_id': room_id,
+            'profile_id': self.profile_id,
+            'frames': encode_event({
+                'event': 'typing' if typing else 'stopped_typing',
+                'room_id': room_id,
+                'profile_id': self.profile_id,
+            }),
+        })
+
+    async def receive_seen(self, subscription, up_to):
+        if not isinstance(up_to, int) or (subscription.seen_up_to is not None and up_to <= subscription.seen_up_to):
+            return
+        subscription.seen_up_to = up_to
+        if subscription.seen_flush is not None:
+            return  # the pending send picks up the newer id
+        wait = subscription.seen_sent_at + SEEN_INTERVAL_SECONDS - time.monotonic()
+        if wait <= 0:
+            await self.send_seen(subscription)
+        else:
+            subscription.seen_flush = asyncio.ensure_future(self.send_seen(subscription, delay=wait))
+
+    async def send_seen(self, subscription, delay=0):
+        if delay:
+            await asyncio.sleep(delay)
+        subscription.seen_flush = None
+        subscription.seen_sent_at = time.monotonic()
+        room_id = subscription.room.id
+        await self.channel_layer.group_send(subscription.group_name, {
+            'type': 'message_seen',
+            'room_id': room_id,
+            'profile_id': self.profile_id,
+            'frames': encode_event({
+                'event': 'seen', 'room_id': room_id, 'profile_id': self.profile_id, 'up_to': subscription.seen_up_to,
+            }),
+        })
+
+    # Indicators and receipts are keyed so a backed up outbox keeps only the latest of each
+
+    async def typing_state(self, event):
+        if event.get('room_id') in self.subscriptions and event.get('profile_id') != self.profile_id:
+            await self.send_encoded(event['frames'], key=('typing', event['room_id'], event['profile_id']))
+
+    async def message_seen(self, event):
+        if event.get('room_id') in self.subscriptions and event.get('profile_id') != self.profile_id:
+            await self.send_encoded(event['frames'], key=('seen', event['room_id'], event['profile_id']))
+
+    async def read_receipt(self, event):
+        # Only the partner needs to hear about the read; the reader's own sockets skip it
+        if event.get('reader_id') == self.profile_id:
+            return
+        if event.get('room_id') in self.subscriptions:
+            await self.send_encoded(event['frames'], key=('read', event['room_id']))
 
     async def chat_message(self, event):
+        subscription = self.subscriptions.get(event.get('room_id'))
+        if subscription is None or event['id'] in subscription.replayed_ids:
+            return  # left the room, or already sent by catch_up
         try:
-            await self.send(text_data=json.dumps({
-                'id': event.get('id'),
-                'message': event.get('message'),
-                'sender_id': event.get('sender_id'),
-                'sender_username': event.get('sender_username'),
-                'timestamp': event.get('timestamp')
-            }))
+            await self.send_encoded(event['frames'])
         except Exception as e:
              print(f"Error sending WebSocket message: {e}")
 
     @database_sync_to_async
-    def check_participation(self):
+    def participant_room(self, room_id):
         try:
-            room = ChatRoom.objects.get(id=self.room_id)
-            if hasattr(self.user, 'profile'):
-                profile = self.user.profile
-                return room.participant1 == profile or room.participant2 == profile
-            return False
-        except ChatRoom.DoesNotExist:
-             print(f"ChatRoom {self.room_id} does not exist in check_participation.")
-             return False
+            # Cached (room_participants): no queries on a warm handshake
+            participants = room_participants(room_id)
+            if participants is None or self.profile_id not in participants:
+                return None
+            # Kept for the connection; save_message, save_read and the writer only need its id
+            return ChatRoom.from_db('default', ['id', 'participant1_id', 'participant2_id'], [room_id, *participants])
         except Exception as e:
-            print(f"Error checking participation for user {self.user.id} in room {self.room_id}: {e}")
-            return False
+            print(f"Error checking participation for user {self.user.id} in room {room_id}: {e}")
+            return None
 
     @database_sync_to_async
-    def save_message(self, content):
+    def save_message(self, room, content):
         try:
-            room = ChatRoom.objects.get(id=self.room_id)
-            message = Message.objects.create(
-                chat_room=room,
-                sender=self.user,
-                content=content
-            )
-            # Optional: Update ChatRoom's last_message_at
-            # room.last_message_at = message.timestamp
-            # room.save(update_fields=['last_message_at'])
+            with transaction.atomic():
+                message = Message.objects.create(
+                    chat_room=room,
+                    sender=self.user,
+                    content=content
+                )
+                # Inbox rows and the room's last_message_at, see messaging.services
+                record_message(message, self.profile_id)
             return message
-        except ChatRoom.DoesNotExist:
-             print(f"ChatRoom {self.room_id} does not exist in save_message.")
-             raise
         except Exception as e:
-            print(f"Error saving message for user {self.user.id} in room {self.room_id}: {e}")
-            raise
\ No newline at end of file
+            print(f"Error saving message for user {self.user.id} in room {room.id}: {e}")
+            raise
+
+    @database_sync_to_async
+    def message_position(self, room, message_id):
+        """(timestamp, id) of a message in `room`, or None."""
+        timestamp = Message.objects.filter(
+            chat_room=room, id=message_id
+        ).values_list('timestamp', flat=True).first()
+        return None if timestamp is None else (timestamp, message_id)
+
+    @database_sync_to_async
+    def missed_messages(self, room, anchor, limit):
+        """Up to `limit` (id, sender_id, content, timestamp) rows after `anchor`; one index range scan."""
+        messages = Message.objects.filter(chat_room=room)
+        return list(newer_messages(messages, *anchor).values_list('id', 'sender_id', 'content', 'timestamp')[:limit])
+
+    @database_sync_to_async
+    def save_read(self, room, up_to):
+        up_to_message = Message.objects.filter(chat_room=room, id=up_to).only('id', 'timestamp').first()
+        if up_to_message is None:
+            return None
+        reader = Profile.from_db('default', ['id', 'user_id'], [self.profile_id, self.user.id])
+        return mark_read(room, reader, up_to_message)
+
+
+class ChatConsumer(RoomEventsConsumer):
+    """One room per socket, ws/chat/<room_id>/; frames may leave out room_id."""
+
+    async def connect(self):
+        self.room_id = self.scope['url_route']['kwargs']['room_id']
+
+        if not await self.authenticate():
+            await self.close()
+            return
+
+        subscription = await self.join(self.room_id)
+        if subscription is None:
+            await self.close()
+            return
+
+        await self.accept_negotiated()
+        await self.presence_connect(self.profile_id)
+
+        last_seen_id = last_seen_id_param(self.scope)
+        if last_seen_id is not None:
+            await self.catch_up(subscription, last_seen_id)
+
+    async def receive_frame(self, data):
+        data['room_id'] = self.room_id
+        await super().receive_frame(data)
+
+
+class UserConsumer(MatchEventsMixin, RoomEventsConsumer):
+    """
+    One socket per user, ws/user/: the user's MESSAGING_SOCKET_ROOMS most
+    recently active rooms plus their personal events. Rooms are added and
+    dropped with {"type": "subscribe" | "unsubscribe", "room_id": <id>};
+    subscribe also takes a `last_seen_id` to replay what was missed.
+    """
+    group_name = None
+
+    async def connect(self):
+        if not await self.authenticate():
+            await self.close()
+            return
+
+        self.group_name = notification_group(self.profile_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        for room in await self.recent_rooms():
+            await self.add_subscription(room)
+
+        await self.accept_negotiated()
+        await self.presence_connect(self.profile_id)
+        await self.send_payload({'event': 'subscribed', 'room_ids': list(self.subscriptions)})
+
+    async def disconnect(self, close_code):
+        await super().disconnect(close_code)
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_frame(self, data):
+        frame_type = data.get('type')
+        if frame_type not in ('subscribe', 'unsubscribe'):
+            await super().receive_frame(data)
+            return
+
+        room_id = data.get('room_id')
+        if not isinstance(room_id, int):
+            return
+        if frame_type == 'unsubscribe':
+            await self.leave(room_id)
+            await self.send_payload({'event': 'unsubscribed', 'room_id': room_id})
+            return
+
+        subscription = await self.join(room_id)
+        if subscription is None:
+            await self.send_payload({'event': 'error', 'room_id': room_id, 'error': 'Not a participant in this room.'})
+            return
+        await self.send_payload({'event': 'subscribed', 'room_ids': [room_id]})
+        last_seen_id = data.get('last_seen_id')
+        if isinstance(last_seen_id, int):
+            await self.catch_up(subscription, last_seen_id)
+
+    async def match_created(self, event):
+        # A match that opened a room starts delivering it right away
+        if event.get('room_id') is not None:
+            await self.join(event['room_id'])
+        await super().match_created(event)
+
+    @database_sync_to_async
+    def recent_rooms(self):
+        """The user's most recently active rooms, from their inbox rows; one index range scan."""
+        room_ids = InboxEntry.objects.filter(
+            owner_id=self.profile_id
+        ).order_by(
+            '-last_message_at', '-id'
+        ).values_list('chat_room_id', flat=True)[:settings.MESSAGING_SOCKET_ROOMS]
+        return [ChatRoom.from_db('default', ['id'], [room_id]) for room_id in room_ids]
+
+
+class NotificationConsumer(MatchEventsMixin, FrameCodecMixin, PresenceMixin, AsyncWebsocketConsumer):
+    """Per-user event stream; currently carries match events from matches.notifications."""
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        self.group_name = None
+
+        if not self.user or not self.user.is_authenticated:
+            await self.close()
+            return
+
+        profile_id = await get_profile_id(self.user)
+        if profile_id is None:
+            await self.close()
+            return
+
+        self.group_name = notification_group(profile_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept_negotiated()
+        await self.presence_connect(profile_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Clients may send anything (e.g. "ping") to stay online while idle
+        await self.presence_heartbeat()
+
+    async def disconnect(self, close_code):
+        await self.presence_disconnect()
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
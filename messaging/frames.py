@@ -0,0 +1,87 @@
+"""
+Wire encoding for WebSocket events.
+
+JSON text frames are the default. A client that offers the
+MSGPACK_SUBPROTOCOL subprotocol on connect gets msgpack binary frames
+instead and may send msgpack frames itself. Events fanned out to a group
+are encoded once by the sender with encode_event(), in both formats, and
+each recipient's consumer forwards the bytes matching its connection
+rather than re-encoding per recipient.
+"""
+import json
+
+import msgpack
+from django.conf import settings
+
+from .outbox import SLOW_CONSUMER_CLOSE_CODE, Outbox
+
+MSGPACK_SUBPROTOCOL = "connect.msgpack"
+
+
+def negotiate(scope):
+    """The subprotocol to accept for a connection's scope, or None for JSON."""
+    if MSGPACK_SUBPROTOCOL in scope.get("subprotocols", ()):
+        return MSGPACK_SUBPROTOCOL
+    return None
+
+
+def encode_json(payload):
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def encode_msgpack(payload):
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def encode_event(payload):
+    """Pre-encoded frames for a group event, keyed by format."""
+    return {"json": encode_json(payload), "msgpack": encode_msgpack(payload)}
+
+
+def decode_frame(text_data=None, bytes_data=None):
+    """A client frame as a dict; raises ValueError for anything else."""
+    if bytes_data is not None:
+        data = msgpack.unpackb(bytes_data, raw=False)
+    else:
+        data = json.loads(text_data)
+    if not isinstance(data, dict):
+        raise ValueError("Frames must be objects.")
+    return data
+
+
+class FrameCodecMixin:
+    """
+    Sends events as JSON text or msgpack bytes, per the negotiated
+    subprotocol, through the connection's bounded Outbox. Pass a `key` for
+    ephemeral events that a newer one may replace (see messaging.outbox).
+    """
+    binary_frames = False
+    outbox = None
+
+    async def accept_negotiated(self):
+        subprotocol = negotiate(self.scope)
+        self.binary_frames = subprotocol == MSGPACK_SUBPROTOCOL
+        await self.accept(subprotocol=subprotocol)
+        self.outbox = Outbox(self.send_frame, self.close_slow, settings.MESSAGING_OUTBOX_SIZE)
+
+    async def send_payload(self, payload, key=None):
+        frame = encode_msgpack(payload) if self.binary_frames else encode_json(payload)
+        await self.outbox.put(frame, key)
+
+    async def send_encoded(self, frames, key=None):
+        await self.outbox.put(frames["msgpack"] if self.binary_frames else frames["json"], key)
+
+    async def send_frame(self, frame):
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    async def close_slow(self, code=SLOW_CONSUMER_CLOSE_CODE):
+        await self.close(code=code)
+
+    async def websocket_disconnect(self, message):
+        # Nothing queued can reach a closed socket
+        if self.outbox is not None:
+            self.outbox.stop()
+        await super().websocket_disconnect(message)
@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from messaging.models import ChatRoom, InboxEntry, Message
+from messaging.services import create_inbox_entries
+
+
+class Command(BaseCommand):
+    help = (
+        "Build InboxEntry rows (last message preview, unread counts) for chat rooms created before the inbox "
+        "existed. Recomputes existing rows, so it is safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Rooms per transaction.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        queryset = ChatRoom.objects.only(
+            "id", "participant1_id", "participant2_id", "created_at", "participant1__user_id", "participant2__user_id"
+        ).select_related("participant1", "participant2").order_by("id")
+
+        total = 0
+        last_id = 0
+        while True:
+            rooms = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not rooms:
+                break
+            last_id = rooms[-1].id
+            room_ids = [room.id for room in rooms]
+
+            last_messages = {
+                message.chat_room_id: message
+                for message in Message.objects.filter(chat_room_id__in=room_ids)
+                .order_by("chat_room_id", "-timestamp", "-id")
+                .distinct("chat_room_id")
+                .only("id", "chat_room_id", "sender_id", "content", "timestamp")
+            }
+            unread = {
+                (row["chat_room_id"], row["sender_id"]): row["count"]
+                for row in Message.objects.filter(chat_room_id__in=room_ids, is_read=False)
+                .values("chat_room_id", "sender_id")
+                .annotate(count=Count("id"))
+            }
+
+            by_room = {room.id: room for room in rooms}
+            with transaction.atomic():
+                create_inbox_entries(rooms)
+                entries = list(InboxEntry.objects.filter(chat_room_id__in=room_ids))
+
+                for entry in entries:
+                    room = by_room[entry.chat_room_id]
+                    # Message.sender is a User; map both participants' users back to profiles
+                    profile_of_user = {
+                        room.participant1.user_id: room.participant1_id,
+                        room.participant2.user_id: room.participant2_id,
+                    }
+                    partner_user_id = room.participant2.user_id if entry.owner_id == room.participant1_id \
+                        else room.participant1.user_id
+
+                    message = last_messages.get(room.id)
+                    if message is None:
+                        entry.last_message_preview = ""
+                        entry.last_message_sender_id = None
+                        entry.last_message_at = room.created_at
+                    else:
+                        entry.last_message_preview = message.content[:InboxEntry.PREVIEW_LENGTH]
+                        entry.last_message_sender_id = profile_of_user.get(message.sender_id)
+                        entry.last_message_at = message.timestamp
+                    entry.unread_count = unread.get((room.id, partner_user_id), 0)
+
+                InboxEntry.objects.bulk_update(
+                    entries,
+                    ["last_message_preview", "last_message_sender", "last_message_at", "unread_count"],
+                    batch_size=1000,
+                )
+                for room_id, message in last_messages.items():
+                    by_room[room_id].last_message_at = message.timestamp
+                ChatRoom.objects.bulk_update(
+                    [by_room[room_id] for room_id in last_messages], ["last_message_at"], batch_size=1000
+                )
+
+            total += len(rooms)
+            self.stdout.write(f"Processed {total} rooms...")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled inbox entries for {total} rooms."))
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from matches.benchmarks import bench_profiles, clear_bench_profiles, seed_profiles
+from messaging.benchmarks import (
+    access_tokens,
+    close_sockets,
+    count_queries,
+    open_sockets,
+    seed_chat_rooms,
+    use_in_memory_channel_layer,
+)
+from messaging.writer import get_message_writer, write_behind_enabled
+
+MESSAGE_PREFIX = "load:"
+
+
+def percentile(ordered, fraction):
+    return ordered[max(0, int(round(fraction * len(ordered))) - 1)] if ordered else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Chat load test: simulated clients exchange messages across rooms through the ASGI application, "
+        "in-process on InMemoryChannelLayer, and report messages/sec, end-to-end latency and DB queries per "
+        "message. Pass --max-* / --min-* thresholds to fail on regressions. "
+        "Writes bench_* users to the configured database; run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=100, help="Simulated users.")
+        parser.add_argument("--rooms-per-client", type=int, default=2)
+        parser.add_argument("--messages", type=int, default=10, help="Messages each client sends per room.")
+        parser.add_argument("--rate", type=float, default=0, help="Messages/sec per socket; 0 sends back to back.")
+        parser.add_argument("--socket", choices=("chat", "user"), default="chat",
+                            help="One ws/chat/ socket per room, or one ws/user/ socket per client.")
+        parser.add_argument("--write-behind", action="store_true", help="Run with MESSAGING_WRITE_BEHIND on.")
+        parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for every delivery.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--max-p95-ms", type=float, default=None)
+        parser.add_argument("--max-queries-per-message", type=float, default=None)
+        parser.add_argument("--min-messages-per-sec", type=float, default=None)
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic users afterwards.")
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        use_in_memory_channel_layer()
+        settings.MESSAGING_WRITE_BEHIND = options["write_behind"]
+        from connect_django.asgi import application
+
+        seed_profiles(options["clients"], stdout=self.stdout)
+        try:
+            profiles = list(bench_profiles().select_related("user").order_by("id")[:options["clients"]])
+            rooms = seed_chat_rooms(profiles, options["rooms_per_client"])
+            tokens = access_tokens(profiles)
+            result = asyncio.run(self.drive(application, profiles, rooms, tokens, options))
+        finally:
+            if not options["keep"]:
+                clear_bench_profiles()
+
+        self.report(profiles, rooms, result, options)
+        self.check_thresholds(result, options)
+
+    def clients(self, profiles, rooms, tokens, mode):
+        """(path, [(room_id, user_id)] it sends as) for every simulated socket."""
+        user_ids = {profile.id: profile.user_id for profile in profiles}
+        if mode == "chat":
+            return [
+                (f"/ws/chat/{room.id}/?token={tokens[profile_id]}", [(room.id, user_ids[profile_id])])
+                for room in rooms for profile_id in (room.participant1_id, room.participant2_id)
+            ]
+        rooms_of = {profile.id: [] for profile in profiles}
+        for room in rooms:
+            for profile_id in (room.participant1_id, room.participant2_id):
+                rooms_of[profile_id].append((room.id, user_ids[profile_id]))
+        return [(f"/ws/user/?token={tokens[profile.id]}", rooms_of[profile.id]) for profile in profiles]
+
+    async def drive(self, application, profiles, rooms, tokens, options):
+        clients = self.clients(profiles, rooms, tokens, options["socket"])
+        sockets = await open_sockets(application, [path for path, _ in clients])
+        if options["socket"] == "user":
+            # Each user socket opens with its "subscribed" frame
+            await asyncio.gather(*(socket.receive_json_from() for socket in sockets))
+
+        per_room = options["messages"]
+        # Both participants send `per_room` messages into each room; each of the two sockets showing a
+        # room receives all of them, its own included
+        expected = [2 * per_room * len(sends) for _, sends in clients]
+        sent_at = {}
+        latencies = []
+        interval = 1 / options["rate"] if options["rate"] else 0
+
+        async def send(socket, sends, client_index):
+            schedule = [(room_id, n) for n in range(per_room) for room_id, _ in sends]
+            random.shuffle(schedule)
+            for room_id, n in schedule:
+                tag = f"{MESSAGE_PREFIX}{client_index}:{room_id}:{n}"
+                sent_at[tag] = time.perf_counter()
+                await socket.send_json_to({"room_id": room_id, "message": tag})
+                if interval:
+                    await asyncio.sleep(interval)
+
+        async def receive(socket, count, own_user_ids, deadline):
+            received = 0
+            while received < count:
+                try:
+                    message = await asyncio.wait_for(socket.output_queue.get(), max(0, deadline - time.perf_counter()))
+                except asyncio.TimeoutError:
+                    break
+                if message["type"] != "websocket.send" or message.get("text") is None:
+                    continue
+                frame = json.loads(message["text"])
+                tag = frame.get("message")
+                if not isinstance(tag, str) or not tag.startswith(MESSAGE_PREFIX):
+                    continue
+                received += 1
+                if frame.get("sender_id") not in own_user_ids:
+                    latencies.append((time.perf_counter() - sent_at[tag]) * 1000)
+            return received
+
+        with count_queries() as queries:
+            started = time.perf_counter()
+            deadline = started + options["timeout"]
+            receivers = [
+                asyncio.ensure_future(receive(socket, count, {user_id for _, user_id in sends}, deadline))
+                for socket, count, (_, sends) in zip(sockets, expected, clients)
+            ]
+            await asyncio.gather(*(
+                send(socket, sends, index) for index, (socket, (_, sends)) in enumerate(zip(sockets, clients))
+            ))
+            received = await asyncio.gather(*receivers)
+            elapsed = time.perf_counter() - started
+            if write_behind_enabled():
+                # Count the batched writes too
+                await get_message_writer().flush()
+
+        await close_sockets(sockets)
+        return {
+            "sockets": len(sockets),
+            "sent": len(sent_at),
+            "delivered": sum(received),
+            "expected": sum(expected),
+            "elapsed": elapsed,
+            "queries": queries[0],
+            "latencies": sorted(latencies),
+        }
+
+    def report(self, profiles, rooms, result, options):
+        latencies = result["latencies"]
+        self.stdout.write(
+            f"{len(profiles)} clients, {len(rooms)} rooms, {result['sockets']} {options['socket']} sockets, "
+            f"write-behind {'on' if options['write_behind'] else 'off'}"
+        )
+        self.stdout.write(f"messages sent      {result['sent']}")
+        self.stdout.write(f"frames delivered   {result['delivered']}/{result['expected']}")
+        self.stdout.write(f"messages/sec       {result['sent'] / result['elapsed']:.1f}")
+        self.stdout.write(
+            f"latency ms         p50 {percentile(latencies, 0.5):.1f}  p95 {percentile(latencies, 0.95):.1f}  "
+            f"p99 {percentile(latencies, 0.99):.1f}  max {latencies[-1] if latencies else 0:.1f}"
+        )
+        self.stdout.write(f"queries/message    {result['queries'] / max(1, result['sent']):.2f}")
+
+    def check_thresholds(self, result, options):
+        failures = []
+        if result["delivered"] < result["expected"]:
+            failures.append(f"only {result['delivered']} of {result['expected']} frames were delivered")
+        p95 = percentile(result["latencies"], 0.95)
+        if options["max_p95_ms"] is not None and p95 > options["max_p95_ms"]:
+            failures.append(f"p95 latency {p95:.1f} ms is over {options['max_p95_ms']} ms")
+        queries_per_message = result["queries"] / max(1, result["sent"])
+        if options["max_queries_per_message"] is not None and queries_per_message > options["max_queries_per_message"]:
+            failures.append(f"{queries_per_message:.2f} queries/message is over {options['max_queries_per_message']}")
+        throughput = result["sent"] / result["elapsed"]
+        if options["min_messages_per_sec"] is not None and throughput < options["min_messages_per_sec"]:
+            failures.append(f"{throughput:.1f} messages/sec is under {options['min_messages_per_sec']}")
+        if failures:
+            raise CommandError("; ".join(failures))
@@ -0,0 +1,98 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIClient
+
+from matches.benchmarks import bench_profiles, clear_bench_profiles, seed_profiles, summarize, time_calls
+from messaging.models import ChatRoom, Message
+from messaging.pagination import encode_cursor
+from messaging.serializers import MessageSerializer
+
+
+def seed_messages(room, senders, count, batch_size=10000, stdout=None):
+    """Fill `room` with `count` messages, one second apart, alternating between `senders`."""
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        Message.objects.bulk_create([
+            Message(chat_room=room, sender=senders[(created + i) % 2], content=f"message {created + i}")
+            for i in range(size)
+        ])
+        created += size
+        if stdout:
+            stdout.write(f"  seeded {created}/{count} messages")
+
+    # A batch is created within milliseconds; spread the timestamps out like a real conversation
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {Message._meta.db_table} SET timestamp = now() - (%s - id) * interval '1 second' "
+            f"WHERE chat_room_id = %s",
+            [Message.objects.filter(chat_room=room).order_by('-id').values_list('id', flat=True).first(), room.id],
+        )
+        cursor.execute(f"ANALYZE {Message._meta.db_table}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare opening a long chat room with the full-history message list against keyset pages. "
+        "Writes bench_* users to the configured database; run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=100000)
+        parser.add_argument("--queries", type=int, default=20)
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic users and messages afterwards.")
+
+    def handle(self, *args, **options):
+        seed_profiles(2, stdout=self.stdout)
+        first, second = bench_profiles().select_related('user')[:2]
+        room, _ = ChatRoom.objects.get_or_create(participant1=first, participant2=second)
+        try:
+            existing = Message.objects.filter(chat_room=room).count()
+            if existing < options["messages"]:
+                seed_messages(room, [first.user, second.user], options["messages"] - existing, stdout=self.stdout)
+            self.run(room, first.user, options)
+        finally:
+            if not options["keep"]:
+                clear_bench_profiles()
+
+    def run(self, room, user, options):
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f"/chat/rooms/{room.id}/messages/"
+        limit = options["limit"]
+
+        def full_history():
+            # What message_list returned before pagination: the whole room, serialized
+            return MessageSerializer(Message.objects.filter(chat_room=room), many=True).data
+
+        def latest_page():
+            return client.get(url, {"limit": limit}).data["messages"]
+
+        history = list(Message.objects.filter(chat_room=room).order_by('id').values_list('id', flat=True))
+        deep_cursors = [
+            encode_cursor(Message.objects.get(id=random.choice(history)))
+            for _ in range(options["queries"])
+        ]
+
+        def deep_page(cursor):
+            return client.get(url, {"limit": limit, "before": cursor}).data["messages"]
+
+        paths = [
+            ("full", full_history, [()] * max(options["queries"] // 5, 1)),
+            ("latest", latest_page, [()] * options["queries"]),
+            ("before", deep_page, [(cursor,) for cursor in deep_cursors]),
+        ]
+
+        self.stdout.write(f"{'messages':>10} {'path':>8} {'p50 ms':>10} {'p95 ms':>10} {'mean ms':>10} {'rows':>8}")
+        for name, fn, args_list in paths:
+            fn(*args_list[0])  # warm up
+            latencies, results = time_calls(fn, args_list)
+            stats = summarize(latencies)
+            rows = sum(len(result) for result in results) / len(results)
+            self.stdout.write(
+                f"{len(history):>10} {name:>8} {stats['p50']:>10.2f} {stats['p95']:>10.2f} "
+                f"{stats['mean']:>10.2f} {rows:>8.0f}"
+            )
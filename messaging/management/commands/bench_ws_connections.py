@@ -0,0 +1,114 @@
+import asyncio
+import time
+import tracemalloc
+from collections import Counter
+
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+
+from matches.benchmarks import bench_profiles, clear_bench_profiles, seed_profiles
+from messaging.benchmarks import (
+    access_tokens,
+    close_sockets,
+    count_queries,
+    forget_cached_identities,
+    open_sockets,
+    receive_frames,
+    seed_chat_rooms,
+    use_in_memory_channel_layer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test: the same users and rooms served by one ws/chat/<room_id>/ socket per room "
+        "versus one multiplexed ws/user/ socket per user, in-process with InMemoryChannelLayer. "
+        "Writes bench_* users to the configured database; run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--rooms", type=int, default=10, help="Rooms per user.")
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic users afterwards.")
+
+    def handle(self, *args, **options):
+        use_in_memory_channel_layer()
+        from connect_django.asgi import application
+
+        seed_profiles(options["users"], stdout=self.stdout)
+        try:
+            profiles = list(bench_profiles().select_related("user").order_by("id")[:options["users"]])
+            rooms = seed_chat_rooms(profiles, options["rooms"])
+            tokens = self.tokens = access_tokens(profiles)
+
+            per_room = [
+                f"/ws/chat/{room.id}/?token={tokens[profile_id]}"
+                for room in rooms for profile_id in (room.participant1_id, room.participant2_id)
+            ]
+            per_user = [f"/ws/user/?token={tokens[profile.id]}" for profile in profiles]
+
+            self.stdout.write(f"{len(profiles)} users, {len(rooms)} rooms")
+            self.stdout.write(
+                f"{'mode':>9} {'sockets':>8} {'groups':>8} {'connect s':>10} {'queries':>8} "
+                f"{'memory KB':>10} {'delivered':>10}"
+            )
+            for mode, paths in (("per-room", per_room), ("per-user", per_user)):
+                forget_cached_identities(profiles, rooms)
+                row = asyncio.run(self.run(application, paths, rooms, per_user=mode == "per-user"))
+                self.stdout.write(
+                    f"{mode:>9} {row['sockets']:>8} {row['groups']:>8} {row['connect']:>10.2f} "
+                    f"{row['queries']:>8} {row['memory'] / 1024:>10.0f} {row['delivered']:>5}/{row['expected']}"
+                )
+        finally:
+            if not options["keep"]:
+                clear_bench_profiles()
+
+    async def run(self, application, paths, rooms, per_user):
+        layer = get_channel_layer()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        with count_queries() as queries:
+            started = time.perf_counter()
+            sockets = await open_sockets(application, paths)
+            connect_seconds = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        memberships = sum(len(channels) for channels in layer.groups.values())
+
+        if per_user:
+            # Each user socket opens with its "subscribed" frame
+            await asyncio.gather(*(socket.receive_json_from() for socket in sockets))
+
+        # One message per room from its first participant; both participants' sockets should get it
+        for room, socket in self.senders(sockets, paths, rooms, per_user):
+            await socket.send_json_to({"room_id": room.id, "message": "load test"})
+        # A per-room socket gets its room's message; a user socket one per room the user is in
+        if per_user:
+            rooms_per_profile = Counter(
+                profile_id for room in rooms for profile_id in (room.participant1_id, room.participant2_id)
+            )
+            # tokens and the per-user paths are both in profile order
+            expected = [rooms_per_profile[profile_id] for profile_id in self.tokens]
+        else:
+            expected = [1] * len(sockets)
+        frames = await asyncio.gather(*(receive_frames(socket, count) for socket, count in zip(sockets, expected)))
+        delivered = sum(1 for received in frames for frame in received if frame.get("message") == "load test")
+
+        await close_sockets(sockets)
+        return {
+            "sockets": len(sockets),
+            "groups": memberships,
+            "connect": connect_seconds,
+            "queries": queries[0],
+            "memory": memory,
+            "delivered": delivered,
+            "expected": 2 * len(rooms),
+        }
+
+    def senders(self, sockets, paths, rooms, per_user):
+        if not per_user:
+            # per-room paths are [room0 participant1, room0 participant2, room1 participant1, ...]
+            return [(room, sockets[2 * i]) for i, room in enumerate(rooms)]
+        # per-user paths are in profile order; find each room's first participant by token
+        by_token = {path.split("token=")[1]: socket for path, socket in zip(paths, sockets)}
+        return [(room, by_token[self.tokens[room.participant1_id]]) for room in rooms]
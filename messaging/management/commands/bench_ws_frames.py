@@ -0,0 +1,75 @@
+import json
+import random
+import string
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+
+from messaging.frames import encode_event, encode_json, encode_msgpack
+
+
+def sample_events(count):
+    """Chat messages of mixed length, with read receipts and typing events mixed in like a live room."""
+    events = []
+    for i in range(count):
+        kind = random.random()
+        if kind < 0.7:
+            length = random.choice((8, 24, 60, 160))
+            events.append({
+                'id': 1_000_000 + i,
+                'message': ''.join(random.choices(string.ascii_letters + ' ', k=length)),
+                'sender_id': random.randint(1, 100000),
+                'sender_username': f'user{random.randint(1, 100000)}',
+                'timestamp': '2025-01-01T12:00:00.123456+00:00',
+            })
+        elif kind < 0.85:
+            events.append({'event': 'read', 'reader_id': random.randint(1, 100000), 'up_to': 1_000_000 + i,
+                           'read_at': '2025-01-01T12:00:00.123456+00:00'})
+        else:
+            events.append({'event': 'typing', 'profile_id': random.randint(1, 100000)})
+    return events
+
+
+def cpu_microseconds(fn, events):
+    started = time.process_time()
+    for event in events:
+        fn(event)
+    return (time.process_time() - started) * 1e6 / len(events)
+
+
+class Command(BaseCommand):
+    help = "Compare WebSocket frame size and encode/decode CPU of JSON text frames against msgpack binary frames."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=100000)
+        parser.add_argument("--recipients", type=int, default=2, help="Sockets in the room group.")
+
+    def handle(self, *args, **options):
+        events = sample_events(options["messages"])
+        recipients = options["recipients"]
+        legacy_frames = [json.dumps(event) for event in events]
+        json_frames = [encode_json(event) for event in events]
+        msgpack_frames = [encode_msgpack(event) for event in events]
+
+        def per_recipient_json(event):
+            # Before: each recipient's handler rebuilt and dumped the event
+            for _ in range(recipients):
+                json.dumps(dict(event))
+
+        rows = (
+            ("json/recipient", sum(len(f.encode()) for f in legacy_frames), cpu_microseconds(per_recipient_json, events),
+             cpu_microseconds(json.loads, legacy_frames)),
+            ("json once", sum(len(f.encode()) for f in json_frames), cpu_microseconds(encode_json, events),
+             cpu_microseconds(json.loads, json_frames)),
+            ("msgpack once", sum(len(f) for f in msgpack_frames), cpu_microseconds(encode_msgpack, events),
+             cpu_microseconds(lambda f: msgpack.unpackb(f, raw=False), msgpack_frames)),
+            ("both once", None, cpu_microseconds(encode_event, events), None),
+        )
+
+        self.stdout.write(f"{len(events)} events, {recipients} recipients per group send")
+        self.stdout.write(f"{'path':>15} {'bytes/msg':>10} {'encode us/msg':>14} {'decode us/msg':>14}")
+        for name, total_bytes, encode_us, decode_us in rows:
+            size = f"{total_bytes / len(events):.1f}" if total_bytes is not None else "-"
+            decode = f"{decode_us:.2f}" if decode_us is not None else "-"
+            self.stdout.write(f"{name:>15} {size:>10} {encode_us:>14.2f} {decode:>14}")
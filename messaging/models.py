@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils.timezone import now
 from user.models import Profile # Assuming Profile is in the 'user' app
 
 class ChatRoom(models.Model):
@@ -40,7 +41,9 @@ class Message(models.Model):
         related_name='sent_messages'
     )
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # A default rather than auto_now_add so the write-behind path (messaging.writer) keeps
+    # the timestamp it broadcast when the row is bulk-inserted later
+    timestamp = models.DateTimeField(default=now)
     is_read = models.BooleanField(default=False)
 
     # --- ADD THIS FIELD BACK ---
@@ -59,6 +62,64 @@ class Message(models.Model):
     class Meta:
         db_table = 'messages'
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pagination of a room's history (messaging.pagination)
+            models.Index(fields=['chat_room', 'timestamp', 'id'], name='messages_room_timeline'),
+            # Read receipts only touch a room's unread messages
+            models.Index(
+                fields=['chat_room', 'timestamp', 'id'],
+                condition=models.Q(is_read=False),
+                name='messages_room_unread',
+            ),
+        ]
 
     def __str__(self):
-        return f"From {self.sender.username} in room {self.chat_room.id} ({self.message_type})"
\ No newline at end of file
+        return f"From {self.sender.username} in room {self.chat_room.id} ({self.message_type})"
+
+
+class InboxEntry(models.Model):
+    """
+    One participant's view of a ChatRoom, kept up to date on every message
+    write (messaging.services.record_message) so the inbox is a single index
+    range scan on (owner, last_message_at) with no per-room subqueries.
+    """
+    PREVIEW_LENGTH = 100
+
+    owner = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name='inbox_entries'
+    )
+    partner = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    chat_room = models.ForeignKey(
+        ChatRoom,
+        on_delete=models.CASCADE,
+        related_name='inbox_entries'
+    )
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default='')
+    last_message_sender = models.ForeignKey(
+        Profile,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    # The room's creation time until its first message, so new rooms sort by when they opened
+    last_message_at = models.DateTimeField()
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'inbox_entries'
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'chat_room'], name='unique_inbox_entry_per_owner'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-last_message_at', '-id']),
+        ]
+
+    def __str__(self):
+        return f"Inbox entry of {self.owner_id} for room {self.chat_room_id}"
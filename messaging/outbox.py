@@ -0,0 +1,123 @@
+"""
+Bounded per-connection send queues.
+
+Consumers hand every outbound frame to their connection's Outbox and
+return straight away; one task per connection writes the frames out in
+order. A connection never holds more than MESSAGING_OUTBOX_SIZE frames:
+
+- Ephemeral frames (typing, seen, read receipts, unread counts) carry a
+  key. A queued frame with the same key is replaced in place, so a slow
+  reader gets the latest state once rather than every change.
+- When the queue is full, an ephemeral frame is dropped. A message frame
+  closes the connection with SLOW_CONSUMER_CLOSE_CODE; the client
+  reconnects with last_seen_id and catches up from the database.
+- If writing a frame fails, the error is logged and the connection is
+  closed with SEND_FAILED_CLOSE_CODE rather than left queueing frames
+  nothing will send.
+
+outbox_metrics() totals queue depth and these events for the process it
+runs in; each server process keeps its own counts.
+"""
+import asyncio
+import logging
+import os
+import socket
+import weakref
+from collections import Counter, OrderedDict
+from itertools import count
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_CLOSE_CODE = 4008
+# "Internal error"
+SEND_FAILED_CLOSE_CODE = 1011
+
+_outboxes = weakref.WeakSet()
+_totals = Counter()
+_sequence = count()
+
+
+class Outbox:
+
+    def __init__(self, send, close, max_size):
+        self._send = send
+        self._close = close
+        self.max_size = max_size
+        # Unkeyed frames get a unique key, so one ordered dict keeps both kinds in order
+        self._queue = OrderedDict()
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.high_water = 0
+        self._writer = asyncio.ensure_future(self._write())
+        _outboxes.add(self)
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    async def put(self, frame, key=None):
+        if self._closed:
+            return
+        if key is not None and key in self._queue:
+            self._queue[key] = frame
+            _totals["coalesced"] += 1
+            return
+        if len(self._queue) >= self.max_size:
+            if key is not None:
+                _totals["dropped"] += 1
+                return
+            logger.warning("Closing a WebSocket that fell %d frames behind", len(self._queue))
+            _totals["closed_slow"] += 1
+            self.stop()
+            await self._close(SLOW_CONSUMER_CLOSE_CODE)
+            return
+        self._queue[key if key is not None else next(_sequence)] = frame
+        self.high_water = max(self.high_water, len(self._queue))
+        self._ready.set()
+
+    def stop(self):
+        self._closed = True
+        self._queue.clear()
+        self._writer.cancel()
+
+    async def _write(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self._queue:
+                    _, frame = self._queue.popitem(last=False)
+                    await self._send(frame)
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Writing a WebSocket frame failed; closing the connection")
+            _totals["send_failed"] += 1
+            self._closed = True
+            self._queue.clear()
+            try:
+                await self._close(SEND_FAILED_CLOSE_CODE)
+            except Exception:
+                logger.exception("Closing a WebSocket after a failed write failed")
+
+
+def outbox_metrics():
+    """
+    Send queue depth and drop/coalesce/close counts for this process's open
+    connections. Nothing is aggregated across processes; `pid` and `host`
+    say which process the numbers belong to.
+    """
+    depths = [outbox.depth for outbox in list(_outboxes) if not outbox._closed]
+    return {
+        "scope": "process",
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "connections": len(depths),
+        "queued": sum(depths),
+        "max_depth": max(depths, default=0),
+        "high_water": max((outbox.high_water for outbox in list(_outboxes)), default=0),
+        "coalesced": _totals["coalesced"],
+        "dropped": _totals["dropped"],
+        "closed_slow": _totals["closed_slow"],
+        "send_failed": _totals["send_failed"],
+    }
@@ -0,0 +1,78 @@
+"""
+Keyset cursors for chat history.
+
+Messages are ordered by (timestamp, id). A cursor is that pair for one
+message, base64 encoded so clients treat it as opaque; `before` reads the
+page of older messages ending just above it and `after` the page of newer
+messages starting just past it. Each page is one range scan on the
+(chat_room, timestamp, id) index, however long the conversation is.
+"""
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(message):
+    payload = [message.timestamp.isoformat(), message.id]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = parse_datetime(timestamp)
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor.")
+    if timestamp is None or not isinstance(message_id, int):
+        raise InvalidCursor("Malformed cursor.")
+    return timestamp, message_id
+
+
+# (timestamp, id) < (t, i) is written as timestamp <= t AND (timestamp < t OR id < i):
+# the first term becomes the index range, the OR alone would be a filter over the room.
+
+
+def newer_messages(messages, timestamp, message_id):
+    """`messages` after the message at (timestamp, message_id), oldest first."""
+    return messages.filter(
+        timestamp__gte=timestamp
+    ).filter(
+        Q(timestamp__gt=timestamp) | Q(id__gt=message_id)
+    ).order_by('timestamp', 'id')
+
+
+def message_page(messages, limit=DEFAULT_PAGE_SIZE, before=None, after=None):
+    """
+    One page of `messages` (a queryset scoped to a room), oldest first.
+
+    Without a cursor this is the newest `limit` messages. Returns (page,
+    before_cursor, after_cursor). before_cursor is None once the start of the
+    conversation is on the page. after_cursor points at the last message
+    returned (or stays at `after` when nothing newer exists yet), so clients
+    can keep polling for newer messages with it.
+    """
+    if after is not None:
+        page = list(newer_messages(messages, *decode_cursor(after))[:limit])
+        has_older = True
+    else:
+        if before is not None:
+            timestamp, message_id = decode_cursor(before)
+            messages = messages.filter(timestamp__lte=timestamp).filter(Q(timestamp__lt=timestamp) | Q(id__lt=message_id))
+        # One extra row tells whether older messages remain
+        page = list(messages.order_by('-timestamp', '-id')[:limit + 1])
+        has_older = len(page) > limit
+        page = page[:limit][::-1]
+
+    before_cursor = encode_cursor(page[0]) if page and has_older else None
+    after_cursor = encode_cursor(page[-1]) if page else after
+    return page, before_cursor, after_cursor
@@ -3,4 +3,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     path('ws/chat/<int:room_id>/', consumers.ChatConsumer.as_asgi()),
+    path('ws/notifications/', consumers.NotificationConsumer.as_asgi()),
+    path('ws/user/', consumers.UserConsumer.as_asgi()),
 ]
\ No newline at end of file
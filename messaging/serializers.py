@@ -1,6 +1,6 @@
 from rest_framework import serializers
-from .models import ChatRoom, Message
-from user.serializers import ProfileSerializer
+from .models import ChatRoom, InboxEntry, Message
+from user.serializers import ProfileCardSerializer, ProfileSerializer
 
 class MessageSerializer(serializers.ModelSerializer):
     sender_username = serializers.ReadOnlyField(source='sender.username')
@@ -23,4 +23,21 @@ class ChatRoomSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ChatRoom
-        fields = ['id', 'participant1', 'participant2', 'created_at']
\ No newline at end of file
+        fields = ['id', 'participant1', 'participant2', 'created_at']
+
+
+class InboxEntrySerializer(serializers.ModelSerializer):
+    room_id = serializers.IntegerField(source='chat_room_id', read_only=True)
+    partner = ProfileCardSerializer(read_only=True)
+    last_message_sender_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = InboxEntry
+        fields = [
+            'room_id',
+            'partner',
+            'last_message_preview',
+            'last_message_sender_id',
+            'last_message_at',
+            'unread_count'
+        ]
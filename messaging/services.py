@@ -0,0 +1,171 @@
+import logging
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .frames import encode_event
+from .models import ChatRoom, InboxEntry, Message
+
+logger = logging.getLogger(__name__)
+
+
+def room_group_name(room_id):
+    """Channel layer group of a room's ChatConsumer connections."""
+    return f'chat_{room_id}'
+
+
+def _participants_key(room_id):
+    return f'room:{room_id}:participants'
+
+
+def room_participants(room_id):
+    """
+    (participant1_id, participant2_id) of a room, or None if it does not
+    exist. Cached for WS_IDENTITY_CACHE_SECONDS so socket handshakes skip
+    the query; messaging.signals drops the entry when the room changes.
+    """
+    key = _participants_key(room_id)
+    participants = cache.get(key)
+    if participants is None:
+        participants = ChatRoom.objects.filter(id=room_id).values_list('participant1_id', 'participant2_id').first()
+        if participants is None:
+            return None
+        cache.set(key, participants, settings.WS_IDENTITY_CACHE_SECONDS)
+    return tuple(participants)
+
+
+def invalidate_room_participants(room_id):
+    cache.delete(_participants_key(room_id))
+
+
+def read_receipt_event(room_id, reader_id, up_to_id, read_at):
+    return {
+        'type': 'read_receipt',
+        'room_id': room_id,
+        'reader_id': reader_id,
+        'frames': encode_event({
+            'event': 'read',
+            'room_id': room_id,
+            'reader_id': reader_id,
+            'up_to': up_to_id,
+            'read_at': read_at.isoformat(),
+        }),
+    }
+
+
+def create_inbox_entries(rooms):
+    """Create the two per-participant inbox rows for each of `rooms`; existing rows are kept."""
+    entries = []
+    for room in rooms:
+        for owner_id, partner_id in (
+            (room.participant1_id, room.participant2_id),
+            (room.participant2_id, room.participant1_id),
+        ):
+            entries.append(InboxEntry(
+                owner_id=owner_id,
+                partner_id=partner_id,
+                chat_room_id=room.id,
+                last_message_at=room.created_at,
+            ))
+    InboxEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def record_message(message, sender_profile_id):
+    """
+    Fold a newly written message into the room's denormalized state: the
+    ChatRoom's last_message_at and both participants' inbox rows, where the
+    recipient's unread count goes up by one. Two UPDATEs, no reads.
+    """
+    record_messages([(message, sender_profile_id)])
+
+
+def record_messages(entries):
+    """
+    record_message for a batch of (message, sender_profile_id) pairs in
+    timestamp order: still two UPDATEs per room, however many messages it got.
+    """
+    by_room = {}
+    for message, sender_profile_id in entries:
+        by_room.setdefault(message.chat_room_id, []).append((message, sender_profile_id))
+
+    for chat_room_id, room_entries in by_room.items():
+        last_message, last_sender_id = room_entries[-1]
+        sent = Counter(sender_profile_id for _, sender_profile_id in room_entries)
+        total = len(room_entries)
+
+        ChatRoom.objects.filter(id=chat_room_id).update(last_message_at=last_message.timestamp)
+        InboxEntry.objects.filter(chat_room_id=chat_room_id).update(
+            last_message_preview=last_message.content[:InboxEntry.PREVIEW_LENGTH],
+            last_message_sender_id=last_sender_id,
+            last_message_at=last_message.timestamp,
+            # Each participant gains the messages the other one sent
+            unread_count=Case(
+                *[When(owner_id=sender_id, then=F('unread_count') + (total - count)) for sender_id, count in sent.items()],
+                default=F('unread_count') + total,
+            ),
+        )
+
+
+def persist_messages(entries):
+    """
+    Insert a batch of prepared (message, sender_profile_id) pairs and fold
+    them into room and inbox state in one transaction. Ids are preassigned,
+    so re-running a batch after a failure cannot duplicate messages.
+    """
+    with transaction.atomic():
+        Message.objects.bulk_create([message for message, _ in entries], ignore_conflicts=True)
+        record_messages(entries)
+
+
+def reserve_message_ids(count):
+    """Draw `count` ids from the messages primary key sequence."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [Message._meta.db_table, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def mark_read(room, reader, up_to):
+    """
+    Mark every unread message `reader` (a Profile) received in `room` up to
+    and including the message `up_to` as read, with one UPDATE over the
+    unread partial index, and take the same number off the reader's inbox
+    unread count. Returns (messages marked, read_at, unread count left).
+    """
+    read_at = timezone.now()
+    with transaction.atomic():
+        marked = Message.objects.filter(
+            chat_room=room,
+            is_read=False,
+            timestamp__lte=up_to.timestamp,
+        ).filter(
+            Q(timestamp__lt=up_to.timestamp) | Q(id__lte=up_to.id)
+        ).exclude(
+            sender_id=reader.user_id
+        ).update(is_read=True, read_at=read_at)
+
+        entries = InboxEntry.objects.filter(chat_room=room, owner=reader)
+        if marked:
+            entries.update(unread_count=Greatest(F('unread_count') - marked, Value(0)))
+        unread_count = entries.values_list('unread_count', flat=True).first() or 0
+    return marked, read_at, unread_count
+
+
+def broadcast_read_receipt(room_id, reader_id, up_to_id, read_at):
+    """Send a read receipt to the room's sockets from synchronous code (the REST endpoint)."""
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            room_group_name(room_id), read_receipt_event(room_id, reader_id, up_to_id, read_at)
+        )
+    except Exception:
+        logger.exception("Broadcasting a read receipt for room %s failed", room_id)
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ChatRoom
+from .services import create_inbox_entries, invalidate_room_participants
+
+
+@receiver(post_save, sender=ChatRoom)
+@receiver(post_delete, sender=ChatRoom)
+def drop_cached_participants(sender, instance, **kwargs):
+    invalidate_room_participants(instance.id)
+
+
+@receiver(post_save, sender=ChatRoom)
+def create_room_inbox_entries(sender, instance, created=False, **kwargs):
+    # However the room was made (API, admin, shell); bulk_create callers add the rows themselves
+    if created:
+        create_inbox_entries([instance])
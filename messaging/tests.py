@@ -1,3 +1,285 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from connect_django.asgi import application
+from user.models import Profile
+from .frames import encode_event
+from .models import ChatRoom, InboxEntry, Message
+from .outbox import SEND_FAILED_CLOSE_CODE, Outbox, outbox_metrics
+from .services import persist_messages, room_group_name
+from .writer import MAX_FLUSH_ATTEMPTS, MessageWriter
+
+# Consumers here run on InMemoryChannelLayer and in-process caches, so the tests need no Redis
+OFFLINE = {
+    "CHANNEL_LAYERS": {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    "PRESENCE_BACKEND": "local",
+}
+
+
+def create_profile(username):
+    user = User.objects.create(username=username, password="!")
+    return Profile.objects.create(user=user, name=username)
+
+
+@database_sync_to_async
+def saved_messages():
+    return list(Message.objects.order_by("id").values_list("id", "content", "is_read"))
+
+
+class ChatRoomTestCase(TransactionTestCase):
+    """Two profiles and the chat room between them."""
+
+    def setUp(self):
+        self.alice = create_profile("alice")
+        self.bob = create_profile("bob")
+        # Created directly, as admin or a shell would; the inbox rows come from messaging.signals
+        self.room = ChatRoom.objects.create(participant1=self.alice, participant2=self.bob)
+
+    async def connect(self, profile, query=""):
+        token = await database_sync_to_async(lambda: str(AccessToken.for_user(profile.user)))()
+        socket = WebsocketCommunicator(application, f"/ws/chat/{self.room.id}/?token={token}{query}")
+        connected, _ = await socket.connect(timeout=5)
+        self.assertTrue(connected)
+        return socket
+
+
+@override_settings(**OFFLINE)
+class MessageWriterTests(ChatRoomTestCase):
+
+    async def submit(self, writer, content):
+        return await writer.submit(self.room.id, self.alice.user, self.alice.id, content)
+
+    async def test_flushes_after_the_interval(self):
+        writer = MessageWriter(flush_size=100, flush_interval=0.05)
+        message = await self.submit(writer, "hello")
+        self.assertEqual(await saved_messages(), [])
+
+        await asyncio.sleep(0.3)
+        self.assertEqual(await saved_messages(), [(message.id, "hello", False)])
+        self.assertEqual(writer.pending, 0)
+
+    async def test_flushes_once_at_the_batch_size(self):
+        writer = MessageWriter(flush_size=2, flush_interval=0.05)
+        with mock.patch.object(writer, "flush", wraps=writer.flush) as flush:
+            first = await self.submit(writer, "one")
+            second = await self.submit(writer, "two")
+            # Long enough for the interval timer to have fired, had the size flush left it running
+            await asyncio.sleep(0.3)
+
+        self.assertEqual(flush.call_count, 1)
+        self.assertIsNone(writer._timer)
+        self.assertEqual(await saved_messages(), [(first.id, "one", False), (second.id, "two", False)])
+
+    async def test_retries_a_failed_flush(self):
+        writer = MessageWriter(flush_size=100, flush_interval=60)
+        calls = []
+
+        def flaky_persist(entries):
+            calls.append(len(entries))
+            if len(calls) == 1:
+                raise DatabaseError("connection lost")
+            persist_messages(entries)
+
+        with mock.patch("messaging.writer.persist_messages", flaky_persist):
+            first = await self.submit(writer, "one")
+            with self.assertLogs("messaging.writer", "ERROR"):
+                await writer.flush()
+            self.assertEqual(writer.pending, 1)
+            self.assertEqual(await saved_messages(), [])
+
+            second = await self.submit(writer, "two")
+            await writer.flush()
+
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(writer.pending, 0)
+        self.assertEqual(await saved_messages(), [(first.id, "one", False), (second.id, "two", False)])
+
+    async def test_drops_messages_after_max_attempts(self):
+        writer = MessageWriter(flush_size=100, flush_interval=60)
+        with mock.patch("messaging.writer.persist_messages", side_effect=DatabaseError("connection lost")):
+            await self.submit(writer, "lost")
+            with self.assertLogs("messaging.writer", "ERROR") as logs:
+                for _ in range(MAX_FLUSH_ATTEMPTS):
+                    await writer.flush()
+
+        self.assertEqual(writer.pending, 0)
+        self.assertIn("Dropped 1 chat messages", logs.output[-1])
+
+
+@override_settings(
+    MESSAGING_WRITE_BEHIND=True, MESSAGING_FLUSH_SIZE=100, MESSAGING_FLUSH_INTERVAL_MS=60000, **OFFLINE
+)
+class ChatConsumerWriteBehindTests(ChatRoomTestCase):
+    """The flush interval is a minute, so only the consumer's own flushes can persist a message."""
+
+    async def test_disconnect_flushes_pending_messages(self):
+        alice = await self.connect(self.alice)
+        await alice.send_json_to({"message": "hello"})
+        frame = await alice.receive_json_from(timeout=5)
+        self.assertEqual(await saved_messages(), [])
+
+        await alice.disconnect(timeout=5)
+        self.assertEqual(await saved_messages(), [(frame["id"], "hello", False)])
+
+    async def test_read_flushes_before_marking(self):
+        alice = await self.connect(self.alice)
+        bob = await self.connect(self.bob)
+        await alice.send_json_to({"message": "hello"})
+        frame = await bob.receive_json_from(timeout=5)
+        await alice.receive_json_from(timeout=5)
+        self.assertEqual(await saved_messages(), [])
+
+        await bob.send_json_to({"type": "read", "up_to": frame["id"]})
+        unread = await bob.receive_json_from(timeout=5)
+        self.assertEqual(unread["event"], "unread")
+        self.assertEqual(unread["unread_count"], 0)
+        self.assertEqual(await saved_messages(), [(frame["id"], "hello", True)])
+
+        await alice.disconnect(timeout=5)
+        await bob.disconnect(timeout=5)
+
+
+@override_settings(**OFFLINE)
+class ReadReceiptTests(ChatRoomTestCase):
+
+    async def test_read_updates_the_count_and_notifies_only_the_partner(self):
+        alice = await self.connect(self.alice)
+        bob = await self.connect(self.bob)
+        ids = []
+        for content in ("one", "two"):
+            await alice.send_json_to({"message": content})
+            ids.append((await bob.receive_json_from(timeout=5))["id"])
+            await alice.receive_json_from(timeout=5)
+
+        await bob.send_json_to({"type": "read", "up_to": ids[0]})
+        unread = await bob.receive_json_from(timeout=5)
+        self.assertEqual((unread["event"], unread["unread_count"]), ("unread", 1))
+        receipt = await alice.receive_json_from(timeout=5)
+        self.assertEqual(receipt["event"], "read")
+        self.assertEqual((receipt["reader_id"], receipt["up_to"]), (self.bob.id, ids[0]))
+        self.assertTrue(await bob.receive_nothing())
+
+        self.assertEqual(await saved_messages(), [(ids[0], "one", True), (ids[1], "two", False)])
+        counts = await database_sync_to_async(lambda: dict(
+            InboxEntry.objects.filter(chat_room=self.room).values_list("owner_id", "unread_count")
+        ))()
+        self.assertEqual(counts, {self.alice.id: 0, self.bob.id: 1})
+
+        await alice.disconnect(timeout=5)
+        await bob.disconnect(timeout=5)
+
+
+@override_settings(**OFFLINE)
+class InboxTests(ChatRoomTestCase):
+
+    async def test_messages_reach_the_inbox_of_a_directly_created_room(self):
+        alice = await self.connect(self.alice)
+        await alice.send_json_to({"message": "hello"})
+        await alice.receive_json_from(timeout=5)
+        await alice.disconnect(timeout=5)
+
+        entries = await database_sync_to_async(lambda: {
+            owner_id: (partner_id, preview, sender_id, unread_count)
+            for owner_id, partner_id, preview, sender_id, unread_count in InboxEntry.objects.filter(
+                chat_room=self.room
+            ).values_list("owner_id", "partner_id", "last_message_preview", "last_message_sender_id", "unread_count")
+        })()
+        self.assertEqual(entries, {
+            self.alice.id: (self.bob.id, "hello", self.alice.id, 0),
+            self.bob.id: (self.alice.id, "hello", self.alice.id, 1),
+        })
+
+
+@override_settings(**OFFLINE)
+class CatchUpTests(ChatRoomTestCase):
+
+    async def send_live(self, message_id):
+        await get_channel_layer().group_send(room_group_name(self.room.id), {
+            "type": "chat_message",
+            "room_id": self.room.id,
+            "id": message_id,
+            "frames": encode_event({"room_id": self.room.id, "id": message_id, "message": f"live {message_id}"}),
+        })
+
+    @mock.patch("messaging.consumers.CATCH_UP_BATCH_SIZE", 2)
+    async def test_skips_live_copies_of_every_replayed_batch(self):
+        ids = await database_sync_to_async(lambda: [
+            Message.objects.create(chat_room=self.room, sender=self.alice.user, content=str(n)).id for n in range(5)
+        ])()
+        bob = await self.connect(self.bob, f"&last_seen_id={ids[0]}")
+        batches = [await bob.receive_json_from(timeout=5) for _ in range(2)]
+        self.assertEqual([[row[0] for row in batch["messages"]] for batch in batches], [ids[1:3], ids[3:5]])
+        caught_up = await bob.receive_json_from(timeout=5)
+        self.assertEqual(caught_up["event"], "caught_up")
+        self.assertEqual(caught_up["replayed"], 4)
+
+        # Live copies of messages from the first and last batches, then a new message
+        await self.send_live(ids[1])
+        await self.send_live(ids[4])
+        await self.send_live(ids[4] + 1)
+        live = await bob.receive_json_from(timeout=5)
+        self.assertEqual(live["id"], ids[4] + 1)
+        self.assertTrue(await bob.receive_nothing())
+
+        await bob.disconnect(timeout=5)
+
+    async def test_delivers_unreplayed_ids_below_the_replayed_maximum(self):
+        # Every other id, as if the gaps were reserved by another process's writer
+        anchor = await database_sync_to_async(lambda: Message.objects.create(
+            chat_room=self.room, sender=self.alice.user, content="0"
+        ).id)()
+        ids = await database_sync_to_async(lambda: [
+            Message.objects.create(chat_room=self.room, sender=self.alice.user, content=str(n), id=anchor + 2 * n).id
+            for n in range(1, 3)
+        ])()
+        bob = await self.connect(self.bob, f"&last_seen_id={anchor}")
+        missed = await bob.receive_json_from(timeout=5)
+        self.assertEqual([row[0] for row in missed["messages"]], ids)
+        await bob.receive_json_from(timeout=5)  # caught_up
+
+        # Committed after the replay with an id under the last replayed one
+        await self.send_live(anchor + 3)
+        await self.send_live(ids[-1])
+        live = await bob.receive_json_from(timeout=5)
+        self.assertEqual(live["id"], anchor + 3)
+        self.assertTrue(await bob.receive_nothing())
+
+        await bob.disconnect(timeout=5)
+
+
+class OutboxTests(SimpleTestCase):
+
+    async def test_closes_the_connection_when_a_send_fails(self):
+        sent, closed = [], []
+
+        async def send(frame):
+            if frame == "broken":
+                raise ConnectionResetError("peer went away")
+            sent.append(frame)
+
+        async def close(code):
+            closed.append(code)
+
+        outbox = Outbox(send, close, max_size=10)
+        failures = outbox_metrics()["send_failed"]
+        with self.assertLogs("messaging.outbox", "ERROR"):
+            await outbox.put("first")
+            await outbox.put("broken")
+            await outbox.put("after")
+            await asyncio.sleep(0.05)
+        await outbox.put("too late")
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(sent, ["first"])
+        self.assertEqual(closed, [SEND_FAILED_CLOSE_CODE])
+        self.assertEqual(outbox.depth, 0)
+        self.assertEqual(outbox_metrics()["send_failed"], failures + 1)
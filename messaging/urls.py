@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import chat_room_list, message_list
+from .views import chat_room_list, inbox, mark_messages_read, message_list, socket_metrics
 
 urlpatterns = [
     path('rooms/', chat_room_list, name='chat-room-list'),
     path('rooms/<int:room_id>/messages/', message_list, name='message-list'),
+    path('rooms/<int:room_id>/read/', mark_messages_read, name='mark-messages-read'),
+    path('inbox/', inbox, name='inbox'),
+    path('metrics/', socket_metrics, name='socket-metrics'),
 ]
\ No newline at end of file
@@ -1,11 +1,17 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.pagination import CursorPagination
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
-from .models import ChatRoom, Message, Profile
-from .serializers import ChatRoomSerializer, MessageSerializer
+from .models import ChatRoom, InboxEntry, Message, Profile
+from .outbox import outbox_metrics
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, message_page
+from .services import broadcast_read_receipt, mark_read
+from .serializers import ChatRoomSerializer, InboxEntrySerializer, MessageSerializer
+from user.serializers import ProfileCardSerializer
+from user.presence import get_presence
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
@@ -40,6 +46,7 @@ def chat_room_list(request):
         p1 = min(current_profile, participant2, key=lambda p: p.id)
         p2 = max(current_profile, participant2, key=lambda p: p.id)
 
+        # Its inbox rows come from messaging.signals
         room, created = ChatRoom.objects.get_or_create(
             participant1=p1,
             participant2=p2
@@ -52,16 +59,104 @@ def chat_room_list(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def message_list(request, room_id):
-    
+    """
+    One page of a room's history, oldest first: the newest `limit` messages,
+    or those `before` / `after` a cursor from a previous page.
+    """
     current_profile = request.user.profile
     room = get_object_or_404(ChatRoom, id=room_id)
 
-    if not (room.participant1 == current_profile or room.participant2 == current_profile):
+    if current_profile.id not in (room.participant1_id, room.participant2_id):
         return Response(
             {'error': 'You are not a participant in this chat room'}, 
             status=status.HTTP_403_FORBIDDEN
         )
-    
-    messages = Message.objects.filter(chat_room=room)
-    serializer = MessageSerializer(messages, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+
+    try:
+        limit = int(request.query_params.get('limit', DEFAULT_PAGE_SIZE))
+    except (ValueError, TypeError):
+        return Response({'error': "'limit' must be a valid integer"}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        return Response(
+            {'error': f"'limit' must be between 1 and {MAX_PAGE_SIZE}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    before = request.query_params.get('before')
+    after = request.query_params.get('after')
+    if before and after:
+        return Response({'error': "Pass either 'before' or 'after', not both"}, status=status.HTTP_400_BAD_REQUEST)
+
+    messages = Message.objects.filter(chat_room=room).select_related('sender')
+    try:
+        page, before_cursor, after_cursor = message_page(messages, limit=limit, before=before, after=after)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = MessageSerializer(page, many=True)
+    return Response(
+        {'messages': serializer.data, 'before': before_cursor, 'after': after_cursor},
+        status=status.HTTP_200_OK
+    )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_messages_read(request, room_id):
+    """Mark every message received in the room up to `up_to` (a message id) as read."""
+    current_profile = request.user.profile
+    room = get_object_or_404(ChatRoom, id=room_id)
+
+    if current_profile.id not in (room.participant1_id, room.participant2_id):
+        return Response(
+            {'error': 'You are not a participant in this chat room'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        up_to_id = int(request.data.get('up_to'))
+    except (ValueError, TypeError):
+        return Response({'error': "'up_to' must be a message id"}, status=status.HTTP_400_BAD_REQUEST)
+    up_to = Message.objects.filter(chat_room=room, id=up_to_id).only('id', 'timestamp').first()
+    if up_to is None:
+        return Response({'error': 'Message not found in this chat room'}, status=status.HTTP_404_NOT_FOUND)
+
+    marked, read_at, unread_count = mark_read(room, current_profile, up_to)
+    if marked:
+        broadcast_read_receipt(room.id, current_profile.id, up_to.id, read_at)
+    return Response({'marked': marked, 'unread_count': unread_count}, status=status.HTTP_200_OK)
+
+
+class InboxPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-last_message_at', '-id')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def inbox(request):
+    """The user's rooms, most recent activity first, from their denormalized InboxEntry rows."""
+    entries = InboxEntry.objects.filter(
+        owner_id=request.user.profile.id
+    ).select_related('partner').only(
+        'id', 'chat_room_id', 'last_message_preview', 'last_message_sender_id', 'last_message_at', 'unread_count',
+        *[f'partner__{field}' for field in ProfileCardSerializer.Meta.fields]
+    )
+
+    paginator = InboxPagination()
+    page = paginator.paginate_queryset(entries, request)
+    serializer = InboxEntrySerializer(page, many=True)
+    data = serializer.data
+    online = get_presence().online([entry['partner']['id'] for entry in data])
+    for entry in data:
+        entry['partner']['online'] = entry['partner']['id'] in online
+    return paginator.get_paginated_response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def socket_metrics(request):
+    """Send queue depth and slow-consumer counts for the WebSockets this process serves."""
+    return Response(outbox_metrics(), status=status.HTTP_200_OK)
@@ -0,0 +1,125 @@
+"""
+Write-behind persistence for chat messages (MESSAGING_WRITE_BEHIND).
+
+With it enabled, ChatConsumer broadcasts a message as soon as it has a
+server-assigned id and timestamp and hands it to the MessageWriter, which
+inserts pending messages with one bulk_create per flush and updates each
+room's last_message_at and inbox rows once per flush (messaging.services
+.persist_messages). Ids are drawn from the messages sequence in blocks of
+ID_BLOCK_SIZE, so the id clients see is the row's real primary key.
+
+Durability:
+- A message is durable once the flush containing it commits. Flushes run
+  when MESSAGING_FLUSH_SIZE messages are pending, at most
+  MESSAGING_FLUSH_INTERVAL_MS after the first pending message, and when a
+  ChatConsumer disconnects; the disconnect waits for that flush.
+- A failed flush keeps its messages pending, in order, and they are retried
+  with the next flush. After MAX_FLUSH_ATTEMPTS failures they are logged and
+  dropped.
+- Messages broadcast but not yet flushed are lost if the process dies. With
+  the defaults that is at most 50 ms worth of messages.
+"""
+import asyncio
+import logging
+import weakref
+from collections import deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Message
+from .services import persist_messages, reserve_message_ids
+
+logger = logging.getLogger(__name__)
+
+ID_BLOCK_SIZE = 100
+MAX_FLUSH_ATTEMPTS = 3
+
+
+class MessageWriter:
+    def __init__(self, flush_size=100, flush_interval=0.05):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = []  # [message, sender_profile_id, failed attempts]
+        self._ids = deque()
+        self._timer = None
+        self._flush_lock = asyncio.Lock()
+        self._tasks = set()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    async def submit(self, chat_room_id, sender, sender_profile_id, content):
+        """Return an unsaved Message with its final id and timestamp, queued for the next flush."""
+        message = Message(
+            id=await self._next_id(),
+            chat_room_id=chat_room_id,
+            sender=sender,
+            content=content,
+            timestamp=timezone.now(),
+        )
+        self._pending.append([message, sender_profile_id, 0])
+
+        if len(self._pending) >= self.flush_size:
+            self._spawn_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._spawn_flush)
+        return message
+
+    async def flush(self):
+        """Persist everything pending now; returns once it is committed or has failed."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                await database_sync_to_async(persist_messages)([(message, sender) for message, sender, _ in batch])
+            except Exception:
+                logger.exception("Flushing %s chat messages failed", len(batch))
+                retry = [[message, sender, attempts + 1] for message, sender, attempts in batch
+                         if attempts + 1 < MAX_FLUSH_ATTEMPTS]
+                if len(retry) < len(batch):
+                    logger.error("Dropped %s chat messages after %s failed flushes",
+                                 len(batch) - len(retry), MAX_FLUSH_ATTEMPTS)
+                self._pending[:0] = retry
+                if self._pending and self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._spawn_flush)
+
+    def _spawn_flush(self):
+        # A size-triggered flush covers what the timer was waiting for
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _next_id(self):
+        if not self._ids:
+            self._ids.extend(await database_sync_to_async(reserve_message_ids)(ID_BLOCK_SIZE))
+        return self._ids.popleft()
+
+
+_writers = weakref.WeakKeyDictionary()
+
+
+def get_message_writer():
+    """The writer for the running event loop (one per process under Daphne)."""
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        writer = _writers[loop] = MessageWriter(
+            flush_size=settings.MESSAGING_FLUSH_SIZE,
+            flush_interval=settings.MESSAGING_FLUSH_INTERVAL_MS / 1000,
+        )
+    return writer
+
+
+def write_behind_enabled():
+    return getattr(settings, "MESSAGING_WRITE_BEHIND", False)
@@ -0,0 +1,152 @@
+import math
+
+# Geohash cells stored on Profile, finest last.
+# Approximate cell size: 3 -> 156km x 156km, 4 -> 39.1km x 19.5km,
+# 5 -> 4.9km x 4.9km, 6 -> 1.2km x 0.61km
+GEO_CELL_PRECISIONS = (3, 4, 5, 6)
+
+# Above this many cells a covering stops helping the planner; fall back to the bounding box.
+MAX_COVERING_CELLS = 48
+
+KM_PER_DEGREE = 111.045
+RADIUS_OF_EARTH_KM = 6371
+# Half the circumference: no two points on the globe are further apart
+MAX_DISTANCE_KM = math.pi * RADIUS_OF_EARTH_KM
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great-circle distance between two points on the Earth (specified in decimal degrees).
+    Returns the distance in kilometers.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    return round(c * RADIUS_OF_EARTH_KM, 2)
+
+
+def encode_geohash(latitude, longitude, precision):
+    """Encode a coordinate as a geohash string of `precision` characters."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    latitude, longitude = float(latitude), float(longitude)
+
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_lo = mid
+            else:
+                bits <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return the (height, width) of a geohash cell in degrees."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """Return (lat_min, lat_max, lon_min, lon_max) of the box enclosing a search radius."""
+    latitude, longitude, radius_km = float(latitude), float(longitude), float(radius_km)
+    lat_change = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(latitude))
+    lon_change = radius_km / (KM_PER_DEGREE * cos_lat) if cos_lat > 1e-9 else 360.0
+    return (
+        latitude - lat_change,
+        latitude + lat_change,
+        longitude - lon_change,
+        longitude + lon_change,
+    )
+
+
+def geo_cells_for(latitude, longitude):
+    """Return {precision: geohash} for every stored precision, or Nones if unset."""
+    if latitude is None or longitude is None:
+        return {precision: None for precision in GEO_CELL_PRECISIONS}
+    full = encode_geohash(latitude, longitude, max(GEO_CELL_PRECISIONS))
+    return {precision: full[:precision] for precision in GEO_CELL_PRECISIONS}
+
+
+def _cell_within(latitude, longitude, inner_km, cell_lat, cell_lon, height, width):
+    """Whether every point of the cell with south-west corner (cell_lat, cell_lon) is nearer than `inner_km`."""
+    # The farthest point of a cell is one of its corners; 0.01 covers haversine's rounding
+    return all(
+        haversine(latitude, longitude, corner_lat, corner_lon) < inner_km - 0.01
+        for corner_lat in (cell_lat, cell_lat + height)
+        for corner_lon in (cell_lon, cell_lon + width)
+    )
+
+
+def covering_cells(latitude, longitude, radius_km, inner_km=None):
+    """
+    Find the geohash cells that cover the bounding box of a radius search.
+
+    Picks the finest stored precision whose covering has at most MAX_COVERING_CELLS
+    cells and returns (precision, cells). Returns (None, []) when no precision is
+    coarse enough, in which case callers should rely on the bounding box alone.
+
+    With `inner_km` the search is an annulus: cells lying entirely within
+    `inner_km` of the centre are left out of the covering.
+    """
+    lat_min, lat_max, lon_min, lon_max = bounding_box(latitude, longitude, radius_km)
+    lat_min, lat_max = max(lat_min, -90.0), min(lat_max, 90.0)
+    if lon_max - lon_min >= 360.0:
+        return None, []
+    latitude, longitude = float(latitude), float(longitude)
+    # Leaving out the inner cells can bring a finer covering under the limit
+    box_limit = MAX_COVERING_CELLS if not inner_km else 2 * MAX_COVERING_CELLS
+
+    for precision in sorted(GEO_CELL_PRECISIONS, reverse=True):
+        height, width = cell_size(precision)
+        row_first = math.floor((lat_min + 90.0) / height)
+        row_last = min(math.floor((lat_max + 90.0) / height), round(180.0 / height) - 1)
+        col_first = math.floor((lon_min + 180.0) / width)
+        col_last = math.floor((lon_max + 180.0) / width)
+        columns_around = round(360.0 / width)
+
+        if (row_last - row_first + 1) * (col_last - col_first + 1) > box_limit:
+            continue
+
+        cells = set()
+        for row in range(row_first, row_last + 1):
+            cell_lat = -90.0 + row * height
+            for col in range(col_first, col_last + 1):
+                # Wrap columns across the antimeridian
+                cell_lon = -180.0 + (col % columns_around) * width
+                if inner_km and _cell_within(latitude, longitude, inner_km, cell_lat, cell_lon, height, width):
+                    continue
+                cells.add(encode_geohash(cell_lat + height / 2, cell_lon + width / 2, precision))
+        if len(cells) > MAX_COVERING_CELLS:
+            continue
+        return precision, sorted(cells)
+
+    return None, []
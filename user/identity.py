@@ -0,0 +1,45 @@
+"""
+Cached user identity for WebSocket handshakes.
+
+Authenticating a socket only needs the user's id, username, active flag
+and profile id. Those are cached under ws-identity:<user_id> for
+WS_IDENTITY_CACHE_SECONDS and dropped by user.signals whenever the User
+is saved or deleted or its Profile is created or deleted, so reconnects
+resolve their user without a query.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F
+
+IDENTITY_FIELDS = ("id", "username", "is_active")
+
+
+def _identity_key(user_id):
+    return f"ws-identity:{user_id}"
+
+
+def identity_user(identity):
+    """
+    A User carrying only IDENTITY_FIELDS, plus `profile_id` (None without a
+    profile). Other fields load on access like any deferred field.
+    """
+    user = User.from_db("default", IDENTITY_FIELDS, [identity[field] for field in IDENTITY_FIELDS])
+    user.profile_id = identity["profile_id"]
+    return user
+
+
+def cached_user(user_id):
+    """The identity User for `user_id`, from the cache when possible; None if it does not exist."""
+    key = _identity_key(user_id)
+    identity = cache.get(key)
+    if identity is None:
+        identity = User.objects.filter(id=user_id).values(*IDENTITY_FIELDS, profile_id=F("profile__id")).first()
+        if identity is None:
+            return None
+        cache.set(key, identity, settings.WS_IDENTITY_CACHE_SECONDS)
+    return identity_user(identity)
+
+
+def invalidate_identity(user_id):
+    cache.delete(_identity_key(user_id))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from user.models import GEO_CELL_FIELDS, Profile
+
+
+class Command(BaseCommand):
+    help = "Populate the geo_cell_* columns for profiles saved before they existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        queryset = Profile.objects.filter(
+            latitude__isnull=False,
+            longitude__isnull=False,
+            geo_cell_6__isnull=True,
+        ).only("id", "latitude", "longitude", *GEO_CELL_FIELDS)
+
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id).order_by("id")[:batch_size])
+            if not batch:
+                break
+            for profile in batch:
+                profile.sync_geo_cells()
+            Profile.objects.bulk_update(batch, GEO_CELL_FIELDS)
+            updated += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"Updated {updated} profiles...")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled geo cells for {updated} profiles."))
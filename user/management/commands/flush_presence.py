@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from user.presence import flush_last_online
+
+
+class Command(BaseCommand):
+    help = "Write buffered presence activity to Profile.last_online now instead of waiting for the next periodic flush."
+
+    def handle(self, *args, **options):
+        flushed = flush_last_online()
+        self.stdout.write(f"Flushed last_online for {flushed} profiles.")
@@ -2,7 +2,11 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
 from django.contrib.postgres.fields import ArrayField
-from django.utils.timezone import now
+from django.contrib.postgres.indexes import GinIndex
+
+from .geo import GEO_CELL_PRECISIONS, geo_cells_for
+
+GEO_CELL_FIELDS = [f"geo_cell_{precision}" for precision in GEO_CELL_PRECISIONS]
 
 class Profile(models.Model):
     # No 'id' field needed, Django adds 'id = AutoField(primary_key=True)' by default
@@ -12,6 +16,8 @@ class Profile(models.Model):
     # Moved default from serializer to model
     gender = models.CharField(max_length=15, blank=True, null=True, default="Not Specified")
     
+    # Legacy swipe storage, no longer written. Swipes live in matches.Swipe;
+    # `manage.py backfill_swipes` copies these arrays over once.
     like = ArrayField(
         models.IntegerField(),
         default=list,
@@ -42,6 +48,14 @@ class Profile(models.Model):
     
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+
+    # Geohash of (latitude, longitude) at each precision in GEO_CELL_PRECISIONS.
+    # Maintained by save(); never set these directly.
+    geo_cell_3 = models.CharField(max_length=3, blank=True, null=True, editable=False)
+    geo_cell_4 = models.CharField(max_length=4, blank=True, null=True, editable=False)
+    geo_cell_5 = models.CharField(max_length=5, blank=True, null=True, editable=False)
+    geo_cell_6 = models.CharField(max_length=6, blank=True, null=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -80,9 +94,21 @@ class Profile(models.Model):
         # The RegexValidator on the field is stronger and handles this.
         # if self.phone_no and not self.phone_no.isdigit():
         #     raise ValueError("Phone number must contain only digits.")
-        
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            self.sync_geo_cells()
+        elif {"latitude", "longitude"} & set(update_fields):
+            self.sync_geo_cells()
+            kwargs["update_fields"] = set(update_fields) | set(GEO_CELL_FIELDS) | {"updated_at"}
+
         super().save(*args, **kwargs)
 
+    def sync_geo_cells(self):
+        """Recompute the geo_cell_* columns from latitude/longitude (does not save)."""
+        for precision, cell in geo_cells_for(self.latitude, self.longitude).items():
+            setattr(self, f"geo_cell_{precision}", cell)
+
     def set_location_coordinates(self, latitude, longitude):
         """Set location coordinates (latitude, longitude) and save."""
         self.latitude = latitude
@@ -90,9 +116,14 @@ class Profile(models.Model):
         self.save()
 
     def update_last_online(self):
-        """Update the last_online field with the current timestamp."""
-        self.last_online = now()
-        self.save(update_fields=["last_online"])
+        """
+        Record activity now. Cheap enough to call per request or socket event:
+        it only touches the presence store, and last_online is written by the
+        next batched presence flush (see user.presence).
+        """
+        from .presence import get_presence
+
+        get_presence().heartbeat(self.id)
 
     def __str__(self):
         return self.name if self.name else self.user.username
@@ -104,4 +135,12 @@ class Profile(models.Model):
         verbose_name_plural = "Profiles"
         indexes = [
             models.Index(fields=['phone_no']),
+            # Cell lookup first, then the discovery preference predicates (gender IN, age range)
+            models.Index(fields=['geo_cell_3', 'gender', 'age']),
+            models.Index(fields=['geo_cell_4', 'gender', 'age']),
+            models.Index(fields=['geo_cell_5', 'gender', 'age']),
+            models.Index(fields=['geo_cell_6', 'gender', 'age']),
+            # "Shares at least one interest" prefilter (interests__overlap) for interest ranking,
+            # and "has all required interests" (interests__contains) for discovery preferences
+            GinIndex(fields=['interests'], name='profiles_interests_gin'),
         ]
\ No newline at end of file
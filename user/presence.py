@@ -0,0 +1,223 @@
+"""
+Presence: who is online, without a database write per event.
+
+Sockets report connect/disconnect and any activity reports a heartbeat.
+A profile is online while it has an open socket or was active within
+PRESENCE_TTL_SECONDS. Events only touch the presence store (Redis in
+production, an in-process stand-in for development and tests, picked by
+PRESENCE_BACKEND) and mark the profile dirty; flush_last_online() writes
+the dirty profiles' last activity to Profile.last_online in one batched
+UPDATE, and marks them dirty again if that UPDATE fails. A background
+thread calls it every PRESENCE_FLUSH_SECONDS, and `manage.py
+flush_presence` does it on demand.
+
+Socket counts are best effort: a process that dies without running its
+disconnects leaves them raised, so such profiles look online until the
+counts are corrected by later connects and disconnects.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LOCAL_BACKEND = "local"
+REDIS_BACKEND = "redis"
+
+
+class LocalPresence:
+    """In-process presence store with the same interface as RedisPresence."""
+
+    def __init__(self, ttl_seconds=60):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._seen = {}
+        self._dirty = set()
+
+    def connect(self, profile_id):
+        with self._lock:
+            self._connections[profile_id] = self._connections.get(profile_id, 0) + 1
+            self._touch(profile_id)
+
+    def disconnect(self, profile_id):
+        with self._lock:
+            remaining = self._connections.get(profile_id, 0) - 1
+            if remaining > 0:
+                self._connections[profile_id] = remaining
+            else:
+                self._connections.pop(profile_id, None)
+            self._touch(profile_id)
+
+    def heartbeat(self, profile_id):
+        with self._lock:
+            self._touch(profile_id)
+
+    def online(self, profile_ids):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            return {
+                profile_id for profile_id in profile_ids
+                if self._connections.get(profile_id) or self._seen.get(profile_id, 0) >= cutoff
+            }
+
+    def take_dirty(self):
+        """Pop the profiles active since the last call, as {profile_id: last active epoch}."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return {profile_id: self._seen[profile_id] for profile_id in dirty}
+
+    def restore_dirty(self, profile_ids):
+        """Mark profiles dirty again after their flush failed."""
+        with self._lock:
+            self._dirty.update(profile_ids)
+
+    def _touch(self, profile_id):
+        self._seen[profile_id] = time.time()
+        self._dirty.add(profile_id)
+
+
+class RedisPresence:
+    """
+    Presence in Redis: a hash of open socket counts, a sorted set of last
+    activity times and a set of profiles not yet flushed to Postgres. Each
+    event is one pipelined round trip; Redis errors are logged and treated
+    as "offline" so presence never fails a request.
+    """
+    CONNECTIONS_KEY = "presence:connections"
+    SEEN_KEY = "presence:seen"
+    DIRTY_KEY = "presence:dirty"
+
+    def __init__(self, url, ttl_seconds=60):
+        self.ttl_seconds = ttl_seconds
+        self._redis = redis.Redis.from_url(url)
+
+    def connect(self, profile_id):
+        self._event(profile_id, connections=1)
+
+    def disconnect(self, profile_id):
+        self._event(profile_id, connections=-1)
+
+    def heartbeat(self, profile_id):
+        self._event(profile_id)
+
+    def online(self, profile_ids):
+        profile_ids = list(profile_ids)
+        if not profile_ids:
+            return set()
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.hmget(self.CONNECTIONS_KEY, profile_ids)
+            pipe.zmscore(self.SEEN_KEY, profile_ids)
+            counts, seen = pipe.execute()
+        except redis.RedisError:
+            logger.warning("Presence lookup failed", exc_info=True)
+            return set()
+        cutoff = time.time() - self.ttl_seconds
+        return {
+            profile_id for profile_id, count, last_seen in zip(profile_ids, counts, seen)
+            if (count is not None and int(count) > 0) or (last_seen is not None and last_seen >= cutoff)
+        }
+
+    def take_dirty(self):
+        # RENAME hands the set to this flusher alone, even with several processes flushing
+        claimed = f"{self.DIRTY_KEY}:flushing:{time.time()}"
+        try:
+            self._redis.rename(self.DIRTY_KEY, claimed)
+        except redis.RedisError:
+            return {}  # Nothing dirty (or Redis unavailable)
+        try:
+            profile_ids = [int(member) for member in self._redis.smembers(claimed)]
+            seen = self._redis.zmscore(self.SEEN_KEY, profile_ids) if profile_ids else []
+        except redis.RedisError:
+            # Hand the claimed profiles back to the next flush
+            self._redis.sunionstore(self.DIRTY_KEY, [self.DIRTY_KEY, claimed])
+            raise
+        finally:
+            self._redis.delete(claimed)
+        return {
+            profile_id: last_seen
+            for profile_id, last_seen in zip(profile_ids, seen) if last_seen is not None
+        }
+
+    def restore_dirty(self, profile_ids):
+        """Mark profiles dirty again after their flush failed."""
+        profile_ids = list(profile_ids)
+        if not profile_ids:
+            return
+        try:
+            self._redis.sadd(self.DIRTY_KEY, *profile_ids)
+        except redis.RedisError:
+            logger.error("Re-marking %s profiles dirty failed; their last_online is lost", len(profile_ids), exc_info=True)
+
+    def _event(self, profile_id, connections=0):
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            if connections:
+                pipe.hincrby(self.CONNECTIONS_KEY, profile_id, connections)
+            pipe.zadd(self.SEEN_KEY, {profile_id: time.time()})
+            pipe.sadd(self.DIRTY_KEY, profile_id)
+            results = pipe.execute()
+            if connections and results[0] <= 0:
+                self._redis.hdel(self.CONNECTIONS_KEY, profile_id)
+        except redis.RedisError:
+            logger.warning("Recording presence for profile %s failed", profile_id, exc_info=True)
+
+
+def flush_last_online(presence=None, batch_size=1000):
+    """Write Profile.last_online for every profile active since the last flush; returns how many."""
+    from .models import Profile
+
+    presence = presence or get_presence()
+    last_seen = presence.take_dirty()
+    profiles = [
+        Profile(id=profile_id, last_online=datetime.fromtimestamp(seen, tz=timezone.utc))
+        for profile_id, seen in last_seen.items()
+    ]
+    try:
+        # bulk_update skips save() and signals, so this does not touch updated_at or the match engine
+        Profile.objects.bulk_update(profiles, ["last_online"], batch_size=batch_size)
+    except Exception:
+        # The claimed profiles are no longer dirty; put them back so the next flush retries them
+        presence.restore_dirty(last_seen)
+        raise
+    return len(profiles)
+
+
+_presence = None
+_presence_lock = threading.Lock()
+
+
+def get_presence():
+    """This process's presence store; starts the periodic last_online flush on first use."""
+    global _presence
+    if _presence is None:
+        with _presence_lock:
+            if _presence is None:
+                ttl_seconds = settings.PRESENCE_TTL_SECONDS
+                if settings.PRESENCE_BACKEND == REDIS_BACKEND:
+                    _presence = RedisPresence(settings.PRESENCE_REDIS_URL, ttl_seconds=ttl_seconds)
+                else:
+                    _presence = LocalPresence(ttl_seconds=ttl_seconds)
+                _start_flusher(settings.PRESENCE_FLUSH_SECONDS)
+    return _presence
+
+
+def _start_flusher(interval):
+    def run():
+        from django.db import connections
+
+        while True:
+            time.sleep(interval)
+            try:
+                flush_last_online()
+            except Exception:
+                logger.exception("Flushing last_online failed")
+            finally:
+                connections.close_all()
+
+    threading.Thread(target=run, name="presence-flush", daemon=True).start()
@@ -9,6 +9,8 @@ class ProfileSerializer(serializers.ModelSerializer):
     """
     Serializer for *displaying* Profile data.
     It automatically reads all defaults and validators from the Profile model.
+    The legacy like/dislike arrays are left out: swipes live in the swipes
+    table (see /match/likes and /match/matches).
     """
 
     class Meta:
@@ -26,9 +28,7 @@ class ProfileSerializer(serializers.ModelSerializer):
             'age', 
             'profile_picture', 
             'pictures',
-            'like',          
             'interests',     
-            'dislike',       
             'last_online',   
             'created_at', 
             'updated_at',
@@ -37,6 +37,18 @@ class ProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at', 'last_online']
 
 
+class ProfileCardSerializer(serializers.ModelSerializer):
+    """
+    Compact, read-only view of a profile for lists (matches, inbox, likes).
+    Select only these fields when querying: Profile.objects.only(*ProfileCardSerializer.Meta.fields)
+    """
+
+    class Meta:
+        model = Profile
+        fields = ['id', 'name', 'gender', 'age', 'profile_picture']
+        read_only_fields = fields
+
+
 # --- Serializers for User Actions (Auth & Updates) ---
 
 class SignupSerializer(serializers.Serializer):
@@ -0,0 +1,24 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .identity import invalidate_identity
+from .models import Profile
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_identity(sender, instance, **kwargs):
+    invalidate_identity(instance.id)
+
+
+@receiver(post_save, sender=Profile)
+def drop_cached_identity_on_new_profile(sender, instance, created=False, **kwargs):
+    # Only creating or deleting a profile changes the cached profile id
+    if created:
+        invalidate_identity(instance.user_id)
+
+
+@receiver(post_delete, sender=Profile)
+def drop_cached_identity_on_profile_delete(sender, instance, **kwargs):
+    invalidate_identity(instance.user_id)
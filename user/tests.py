@@ -1,3 +1,63 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .geo import covering_cells, encode_geohash, haversine
+from .models import Profile
+from .presence import LocalPresence, flush_last_online
+
+
+class FlushLastOnlineTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username="alice", password="!")
+        self.profile = Profile.objects.create(user=user, name="alice")
+        self.presence = LocalPresence()
+        self.presence.heartbeat(self.profile.id)
+
+    def test_failed_update_keeps_profiles_dirty(self):
+        with mock.patch.object(Profile.objects, "bulk_update", side_effect=DatabaseError("deadlock detected")):
+            with self.assertRaises(DatabaseError):
+                flush_last_online(self.presence)
+
+        self.assertEqual(flush_last_online(self.presence), 1)
+        self.profile.refresh_from_db()
+        self.assertIsNotNone(self.profile.last_online)
+        self.assertEqual(flush_last_online(self.presence), 0)
+
+
+class CoveringCellsTests(SimpleTestCase):
+    CENTRE = (12.97, 77.59)
+
+    def test_annulus_leaves_out_only_cells_inside_the_inner_radius(self):
+        precision, disk = covering_cells(*self.CENTRE, 80)
+        annulus_precision, annulus = covering_cells(*self.CENTRE, 80, inner_km=40)
+        self.assertEqual(annulus_precision, precision)
+        self.assertLess(set(annulus), set(disk))
+
+        # Every point between the radii still falls in a covered cell
+        for step in range(400):
+            latitude = self.CENTRE[0] - 0.75 + 1.5 * (step % 20) / 19
+            longitude = self.CENTRE[1] - 0.75 + 1.5 * (step // 20) / 19
+            if 40 < haversine(*self.CENTRE, latitude, longitude) <= 80:
+                self.assertIn(encode_geohash(latitude, longitude, precision), annulus)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class FindProfilesTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username="alice", password="!")
+        profile = Profile.objects.create(user=user, name="alice", latitude=12.97, longitude=77.59)
+        self.client = APIClient()
+        self.client.force_authenticate(profile.user)
+
+    def test_rejects_non_finite_and_non_positive_radii(self):
+        for params in ({"radius": "nan"}, {"radius": "inf"}, {"radius": 0}, {"radius": -1},
+                       {"radius": 1, "max_radius": "inf"}, {"radius": 1, "max_radius": "nan"}):
+            response = self.client.get(reverse("find-profiles"), params)
+            self.assertEqual(response.status_code, 400, params)
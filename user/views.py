@@ -10,10 +10,9 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.decorators import api_view, permission_classes
 from django.db.models import Q
-import math
-import decimal
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
+import math
 import traceback
 
 from connect_django import settings
@@ -21,6 +20,8 @@ from connect_django import settings
 # Local imports
 from .models import Profile
 from .services import create_user_and_profile
+from matches.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, nearby_page
+from matches.services import record_swipe
 from .serializers import (
     LoginSerializer,
     ProfileSerializer,
@@ -164,17 +165,6 @@ class BulkSignupView(APIView):
 
 # --- App-Specific Views (Matching, Finding) ---
 
-def haversine(lat1, lon1, lat2, lon2):
-    lat1, lon1, lat2, lon2 = map(math.radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
-
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    radius_of_earth_km = 6371
-    return round(c * radius_of_earth_km, 2)
-
-
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def updateList(request):
@@ -197,7 +187,7 @@ def updateList(request):
             )
 
         try:
-            partner_profile = Profile.objects.get(id=other_id)
+            partner_profile = Profile.objects.only('id', 'name').get(id=other_id)
         except Profile.DoesNotExist:
             return Response(
                 {"status": "error", "message": "Partner profile not found"}, 
@@ -210,18 +200,9 @@ def updateList(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        match = False
+        match = record_swipe(user_profile, other_id, action)
 
         if action == "like":
-            if user_profile.id in partner_profile.like:
-                match = True
-            
-            if other_id not in user_profile.like:
-                user_profile.like.append(other_id)
-                if other_id in user_profile.dislike:
-                    user_profile.dislike.remove(other_id)
-                user_profile.save(update_fields=["like", "dislike"])
-
             response_data = {
                 "name": partner_profile.name,
                 "status": "success",
@@ -231,12 +212,6 @@ def updateList(request):
             return Response(response_data, status=status.HTTP_200_OK)
 
         elif action == "dislike":
-            if other_id not in user_profile.dislike:
-                user_profile.dislike.append(other_id)
-                if other_id in user_profile.like:
-                    user_profile.like.remove(other_id)
-                user_profile.save(update_fields=["dislike", "like"])
-
             response_data = {
                 "name": partner_profile.name,
                 "status": "success",
@@ -267,56 +242,55 @@ def find_profiles(request):
 
         try:
             radius_km = float(request.query_params.get('radius', 5))
+            if not math.isfinite(radius_km):
+                raise ValueError
         except (ValueError, TypeError):
             return Response(
                 {"error": "'radius' must be a valid number."}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if radius_km <= 0:
+            return Response({"error": "'radius' must be positive."}, status=status.HTTP_400_BAD_REQUEST)
 
-        current_lat = current_profile.latitude
-        current_lon = current_profile.longitude
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_PAGE_SIZE))
+        except (ValueError, TypeError):
+            return Response({"error": "'limit' must be a valid integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            return Response(
+                {"error": f"'limit' must be between 1 and {MAX_PAGE_SIZE}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        max_radius_km = request.query_params.get('max_radius')
+        if max_radius_km is not None:
+            try:
+                max_radius_km = float(max_radius_km)
+                if not math.isfinite(max_radius_km):
+                    raise ValueError
+            except (ValueError, TypeError):
+                return Response({"error": "'max_radius' must be a valid number."}, status=status.HTTP_400_BAD_REQUEST)
+            if max_radius_km < radius_km:
+                return Response(
+                    {"error": "'radius' must be no larger than 'max_radius'."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        try:
+            nearby_profiles, next_cursor, radius_used = nearby_page(
+                current_profile, radius_km, limit=limit, cursor=request.query_params.get('cursor'),
+                max_radius_km=max_radius_km,
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        lat_change = radius_km / decimal.Decimal('111.045')
-        lon_change = radius_km / (decimal.Decimal('111.045') * decimal.Decimal(math.cos(math.radians(current_lat))))
-        
-        lat_min = current_lat - lat_change
-        lat_max = current_lat + lat_change
-        lon_min = current_lon - lon_change
-        lon_max = current_lon + lon_change
-        
-        seen_ids = set(current_profile.like) | set(current_profile.dislike)
-        seen_ids.add(current_profile.id)
-
-        potential_matches = Profile.objects.filter(
-            latitude__range=(lat_min, lat_max),
-            longitude__range=(lon_min, lon_max),
-            latitude__isnull=False,
-            longitude__isnull=False
-        ).exclude(
-            id__in=seen_ids
-        ).exclude(
-            gender=current_profile.gender
-        )
-        
-        nearby_profiles = []
-        for profile in potential_matches:
-            distance = haversine(current_lat, current_lon, profile.latitude, profile.longitude)
-            
-            if distance <= radius_km:
-                nearby_profiles.append({
-                    "id": profile.id,
-                    "name": profile.name,
-                    "gender": profile.gender,
-                    "age": profile.age, 
-                    "distance": distance,
-                    "profile_picture": profile.profile_picture,
-                    "about": profile.about,
-                })
-        
-        nearby_profiles.sort(key=lambda p: p["distance"])
-        
         return Response(
-            {"total_profiles": len(nearby_profiles), "nearby_profiles": nearby_profiles},
+            {
+                "total_profiles": len(nearby_profiles),
+                "nearby_profiles": nearby_profiles,
+                "radius": radius_used,
+                "next_cursor": next_cursor,
+            },
             status=status.HTTP_200_OK
         )
 